@@ -0,0 +1,73 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = 'default'
+
+class Account:
+    """
+    One WinFleet account polled by this process.
+    Each account has its own HTTP session, token cache and request budget,
+    plus the per-account job status reported on /health.
+    """
+
+    def __init__(self, tenant, base_url, username, password, session, token_cache, rate_limiter):
+        self.tenant = tenant
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.session = session
+        self.token_cache = token_cache
+        self.rate_limiter = rate_limiter
+        self.last_job_success = False
+        self.last_job_time = None
+        self.skipped_unchanged_last = 0
+        self.skipped_unchanged_total = 0
+
+    def record_result(self, success, when):
+        self.last_job_success = success
+        self.last_job_time = when
+
+    def record_skipped(self, skipped):
+        self.skipped_unchanged_last = skipped
+        self.skipped_unchanged_total += skipped
+
+def load_account_configs(path, default_base_url, default_username, default_password):
+    """
+    Read the accounts to poll from a JSON file of the form
+    [{"tenant": "fleet_a", "username": "...", "password": "...", "base_url": "..."}, ...].
+    Without a file, the single API_USERNAME / API_PASSWORD account is used as tenant 'default'.
+    """
+    if not path:
+        return [{
+            'tenant': DEFAULT_TENANT,
+            'base_url': default_base_url,
+            'username': default_username,
+            'password': default_password
+        }]
+
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"Accounts file {path} must contain a non-empty JSON list")
+
+    configs = []
+    seen_tenants = set()
+    for entry in entries:
+        missing = [field for field in ('tenant', 'username', 'password') if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Account entry missing required fields {missing}: {entry.get('tenant', 'unknown')}")
+        if entry['tenant'] in seen_tenants:
+            raise ValueError(f"Duplicate tenant {entry['tenant']} in accounts file {path}")
+        seen_tenants.add(entry['tenant'])
+        configs.append({
+            'tenant': entry['tenant'],
+            'base_url': entry.get('base_url', default_base_url),
+            'username': entry['username'],
+            'password': entry['password']
+        })
+
+    logger.info(f"Loaded {len(configs)} accounts from {path}")
+    return configs
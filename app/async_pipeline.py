@@ -0,0 +1,268 @@
+import asyncio
+import json
+import logging
+import time
+
+import asyncpg
+import httpx
+
+from token_cache import TokenExpiredError
+from dimensions import POSITION_COLUMNS, position_rows
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class AsyncFetcher:
+    """
+    Non-blocking counterpart of get_access_token / get_assets using httpx.
+    Shares the token cache and rate limiter with the synchronous path.
+    """
+
+    def __init__(self, account, timeout=30):
+        self.tenant = account.tenant
+        self.base_url = account.base_url
+        self.username = account.username
+        self.password = account.password
+        self.token_cache = account.token_cache
+        self.rate_limiter = account.rate_limiter
+        self.client = httpx.AsyncClient(
+            headers={'User-Agent': 'DataCollector/1.0'},
+            timeout=timeout,
+            transport=httpx.AsyncHTTPTransport(retries=3)
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def get_access_token(self, force_refresh=False):
+        """Return the cached token, logging in only when it is missing, stale or rejected."""
+        if force_refresh:
+            self.token_cache.invalidate()
+        token = self.token_cache.get()
+        if token:
+            return token
+
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await self.client.post(
+                f"{self.base_url}/login",
+                json={"username": self.username, "password": self.password},
+                headers={"Content-Type": "application/json"}
+            )
+            response.raise_for_status()
+            token = self.token_cache.store(response.json())
+            outcome = 'ok'
+            return token
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Authentication failed for {self.tenant}: {e}")
+            return None
+        finally:
+            metrics.LOGIN_SECONDS.labels(self.tenant, outcome).observe(time.perf_counter() - started)
+
+    async def get_assets(self, token):
+        """Fetch /v1/assets/, waiting on the rate limiter without blocking the event loop."""
+        waited = 0.0
+        delay = self.rate_limiter.time_until_available()
+        while not self.rate_limiter.try_acquire():
+            logger.info(f"Rate limit reached for {self.tenant}. Waiting {delay:.2f} seconds")
+            await asyncio.sleep(delay)
+            waited += delay
+            delay = self.rate_limiter.time_until_available()
+        metrics.RATE_LIMIT_WAIT_SECONDS.labels(self.tenant).observe(waited)
+
+        assets_url = f"{self.base_url}/v1/assets/"
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await self.client.get(
+                assets_url,
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+            )
+            if response.status_code == 401:
+                outcome = 'unauthorized'
+                raise TokenExpiredError(f"401 from {assets_url}")
+            response.raise_for_status()
+            metrics.GET_ASSETS_BYTES.labels(self.tenant).observe(len(response.content))
+            assets_data = response.json()
+            outcome = 'ok'
+            return assets_data
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Failed to retrieve assets data for {self.tenant}: {e}")
+            return None
+        finally:
+            metrics.GET_ASSETS_SECONDS.labels(self.tenant, outcome).observe(time.perf_counter() - started)
+
+class AsyncWriter:
+    """
+    asyncpg-based writer for prepared vehicle status rows (tuples in the given columns order).
+    Assets and status codes are resolved through dimensions before the narrow posts rows are upserted.
+    Falls back to savepoint bisection and the dead-letter table like the sync writer.
+    before_store(rows) is awaited before each batch and must not block the event loop;
+    after_insert(conn, rows, status_ids) runs in the same transaction as the upsert of the stored rows.
+    reject(rows) returns (accepted, [(row, error), ...]); rejected rows go straight to the dead-letter table.
+    """
+
+    def __init__(self, dsn_kwargs, columns, conflict_clause, dimensions, min_size=1, max_size=5, before_store=None,
+                 after_insert=None, reject=None):
+        self.dsn_kwargs = dsn_kwargs
+        self.columns = columns
+        self.dimensions = dimensions
+        placeholders = ', '.join(f"${i}" for i in range(1, len(POSITION_COLUMNS) + 1))
+        self.insert_sql = f"INSERT INTO posts ({', '.join(POSITION_COLUMNS)}) VALUES ({placeholders})" + conflict_clause
+        self.min_size = min_size
+        self.max_size = max_size
+        self.before_store = before_store
+        self.after_insert = after_insert
+        self.reject = reject
+        self.pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def start(self):
+        """Create the pool; store() does this on first use, so a database that is down never blocks polling."""
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(min_size=self.min_size, max_size=self.max_size, **self.dsn_kwargs)
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+
+    async def _isolate_bad_rows(self, conn, rows, bad_rows, status_ids):
+        if not rows:
+            return
+        try:
+            async with conn.transaction():
+                await conn.executemany(self.insert_sql, position_rows(rows, status_ids))
+            return
+        except asyncpg.PostgresError as e:
+            if len(rows) == 1:
+                logger.error(f"Error storing row with asset_id {rows[0][0]}: {e}")
+                bad_rows.append((rows[0], str(e).strip()))
+                return
+        middle = len(rows) // 2
+        await self._isolate_bad_rows(conn, rows[:middle], bad_rows, status_ids)
+        await self._isolate_bad_rows(conn, rows[middle:], bad_rows, status_ids)
+
+    async def _store_dead_letters(self, conn, bad_rows):
+        await conn.executemany(
+            "INSERT INTO posts_dead_letter (asset_id, event_time, payload, error) VALUES ($1, $2, $3::jsonb, $4)",
+            [
+                (row[0], row[5], json.dumps(dict(zip(self.columns, row)), default=str), error)
+                for row, error in bad_rows
+            ]
+        )
+
+    async def store(self, rows):
+        """Store prepared rows (tuples in posts column order). Returns True on success."""
+        if not rows:
+            logger.info("No data to store")
+            return True
+
+        rejected = []
+        if self.reject:
+            rows, rejected = self.reject(rows)
+
+        if self.before_store:
+            try:
+                await self.before_store(rows)
+            except Exception as e:
+                logger.warning(f"Pre-store hook failed: {e}")
+
+        started = time.perf_counter()
+        try:
+            if self.pool is None:
+                await self.start()
+            async with self.pool.acquire() as conn:
+                try:
+                    async with conn.transaction():
+                        status_ids, pending = await self.dimensions.prepare_async(conn, rows)
+                        if rows:
+                            await conn.executemany(self.insert_sql, position_rows(rows, status_ids))
+                        if self.after_insert:
+                            await self.after_insert(conn, rows, status_ids)
+                        if rejected:
+                            await self._store_dead_letters(conn, rejected)
+                    self.dimensions.remember(pending)
+                    metrics.DEAD_LETTER_ROWS.inc(len(rejected))
+                    metrics.observe_write('async', len(rows), time.perf_counter() - started)
+                    logger.info(f"Inserted/Updated {len(rows)} vehicle status records in batch (async)")
+                    return True
+                except asyncpg.PostgresError as e:
+                    metrics.WRITE_FALLBACKS.labels('savepoint_split').inc()
+                    logger.warning(f"Batch insert failed: {e}. Isolating bad rows with savepoints")
+
+                async with conn.transaction():
+                    bad_rows = []
+                    status_ids, pending = await self.dimensions.prepare_async(conn, rows)
+                    await self._isolate_bad_rows(conn, rows, bad_rows, status_ids)
+                    if bad_rows or rejected:
+                        await self._store_dead_letters(conn, bad_rows + rejected)
+                    if bad_rows:
+                        logger.warning(f"Moved {len(bad_rows)} of {len(rows)} rows to posts_dead_letter")
+                    if self.after_insert:
+                        bad_ids = {id(row) for row, _ in bad_rows}
+                        await self.after_insert(conn, [row for row in rows if id(row) not in bad_ids], status_ids)
+                self.dimensions.remember(pending)
+                metrics.DEAD_LETTER_ROWS.inc(len(bad_rows) + len(rejected))
+                metrics.observe_write('savepoint_split', len(rows) - len(bad_rows), time.perf_counter() - started)
+                return True
+        except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+            logger.error(f"Database error while storing data: {e}")
+            return False
+
+async def poll_once(fetcher, writer, prepare, last_seen_cache, on_failed=None):
+    """
+    One fetch -> prepare -> store cycle. Returns (success, skipped_unchanged).
+    Rows the writer could not store are handed to on_failed(rows), e.g. the spool.
+    prepare and on_failed are blocking (parsing, compression, gzip, fsync) and run
+    in the default executor so they never stall the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    token = await fetcher.get_access_token()
+    if not token:
+        logger.error(f"Failed to obtain access token for {fetcher.tenant}")
+        return False, 0
+
+    try:
+        assets_data = await fetcher.get_assets(token)
+    except TokenExpiredError:
+        logger.warning(f"Access token for {fetcher.tenant} rejected, logging in again")
+        token = await fetcher.get_access_token(force_refresh=True)
+        assets_data = await fetcher.get_assets(token) if token else None
+    if not assets_data:
+        logger.error(f"Failed to fetch assets data for {fetcher.tenant}")
+        return False, 0
+
+    prepared = await loop.run_in_executor(None, prepare, assets_data)
+    rows, skipped = last_seen_cache.filter_unchanged(prepared)
+    try:
+        stored = await writer.store(rows)
+    except Exception as e:
+        logger.error(f"Unexpected error while storing data for {fetcher.tenant}: {e}")
+        stored = False
+    if not stored:
+        if on_failed:
+            await loop.run_in_executor(None, on_failed, rows)
+        return False, skipped
+    last_seen_cache.mark_stored(rows)
+    return True, skipped
+
+async def run_polling(fetcher, writer, prepare, last_seen_cache, interval, on_cycle, on_failed=None):
+    """
+    Poll one account forever on the current event loop, calling on_cycle(success, skipped)
+    after each cycle. The writer is shared between accounts and started by the caller.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            started = loop.time()
+            try:
+                success, skipped = await poll_once(fetcher, writer, prepare, last_seen_cache, on_failed)
+            except Exception as e:
+                logger.error(f"Unexpected error in async polling cycle for {fetcher.tenant}: {e}")
+                success, skipped = False, 0
+            on_cycle(success, skipped)
+            await asyncio.sleep(max(0, interval - (loop.time() - started)))
+    finally:
+        await fetcher.close()
@@ -0,0 +1,154 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class BatchWriter:
+    """
+    Dedicated writer thread fed through a bounded queue.
+    Producers submit prepared batches and block (up to a timeout) when the queue is full.
+    The writer merges queued batches and flushes them in one transaction once
+    flush_rows rows are pending or the oldest pending batch is flush_interval seconds old.
+    A successful submit() only means the batch was queued; whether it was stored is
+    reported by the flush outcome (healthy(), last_flush_success, last_flush_error).
+    """
+
+    def __init__(self, store, on_stored, key, max_batches=100, flush_rows=5000, flush_interval=5.0,
+                 put_timeout=30.0, max_attempts=3, on_failed=None):
+        self.store = store
+        self.on_stored = on_stored
+        self.on_failed = on_failed
+        self.key = key
+        self.max_batches = max_batches
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue(maxsize=max_batches)
+        self._thread = threading.Thread(target=self._run, name='batch-writer', daemon=True)
+        self._lock = threading.Lock()
+        self._pending_rows = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_rows = 0
+        self.last_flush_duration = None
+        self.last_flush_delay = None
+        self.last_flush_time = None
+        self.last_flush_success = None
+        self.last_flush_error = None
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"Batch writer started (queue {self.max_batches} batches, flush at {self.flush_rows} rows or {self.flush_interval}s)")
+
+    def stop(self, timeout=30):
+        """Flush whatever is queued and stop the writer thread"""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def submit(self, rows):
+        """Queue a batch for writing. Returns False if the queue stayed full for put_timeout seconds."""
+        if not rows:
+            return True
+        try:
+            self._queue.put((time.monotonic(), rows), timeout=self.put_timeout)
+        except queue.Full:
+            logger.error(f"Write queue full for {self.put_timeout}s, rejecting batch of {len(rows)} rows")
+            return False
+        with self._lock:
+            self._pending_rows += len(rows)
+        return True
+
+    def healthy(self):
+        """False while the most recent flush failed, until a later flush succeeds"""
+        with self._lock:
+            return self.last_flush_success is not False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "status": "unhealthy" if self.last_flush_success is False else "healthy",
+                "queue_depth": self._queue.qsize(),
+                "queue_max_batches": self.max_batches,
+                "pending_rows": self._pending_rows,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "last_flush_rows": self.last_flush_rows,
+                "last_flush_duration_seconds": round(self.last_flush_duration, 3) if self.last_flush_duration is not None else None,
+                "last_flush_delay_seconds": round(self.last_flush_delay, 3) if self.last_flush_delay is not None else None,
+                "last_flush_time": self.last_flush_time.isoformat() if self.last_flush_time else None,
+                "last_flush_error": self.last_flush_error
+            }
+
+    def _run(self):
+        pending = []
+        pending_since = None
+        stopping = False
+        while not stopping:
+            if pending:
+                wait = max(0.0, pending_since + self.flush_interval - time.monotonic())
+            else:
+                wait = self.flush_interval
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                enqueued_at, rows = item
+                if not pending:
+                    pending_since = enqueued_at
+                pending.extend(rows)
+
+            if pending and (stopping or len(pending) >= self.flush_rows
+                            or time.monotonic() - pending_since >= self.flush_interval):
+                self._flush(pending, pending_since)
+                pending = []
+                pending_since = None
+
+    def _flush(self, pending, pending_since):
+        # Later batches win for the same key, so one upsert never touches a row twice
+        merged = list({self.key(row): row for row in pending}.values())
+        started = time.monotonic()
+        success = False
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                success = self.store(merged)
+                error = None if success else "store failed"
+            except Exception as e:
+                logger.error(f"Unexpected error in batch writer flush: {e}")
+                success = False
+                error = str(e)
+            if success:
+                break
+            if attempt < self.max_attempts:
+                wait_time = 2 ** attempt
+                logger.warning(f"Flush attempt {attempt}/{self.max_attempts} failed. Waiting {wait_time} seconds")
+                time.sleep(wait_time)
+
+        finished = time.monotonic()
+        if success:
+            self.on_stored(merged)
+        else:
+            logger.error(f"Batch writer failed to store {len(merged)} rows after {self.max_attempts} attempts")
+            if self.on_failed:
+                self.on_failed(merged)
+
+        with self._lock:
+            self._pending_rows = max(0, self._pending_rows - len(pending))
+            self.flushes += 1
+            self.failed_flushes += 0 if success else 1
+            self.last_flush_rows = len(merged)
+            self.last_flush_duration = finished - started
+            self.last_flush_delay = finished - pending_since
+            self.last_flush_time = datetime.now()
+            self.last_flush_success = success
+            self.last_flush_error = None if success else f"{error} after {self.max_attempts} attempts"
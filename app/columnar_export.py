@@ -0,0 +1,191 @@
+"""
+Export closed posts partitions to Parquet (or Arrow IPC) files for analytics.
+
+Usage:
+    python columnar_export.py [--format parquet|arrow] [--dir DIR] [--force] [partition ...]
+"""
+import argparse
+import logging
+import os
+from decimal import Decimal
+import psycopg2
+from psycopg2 import sql
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+EXPORT_SCHEMA = pa.schema([
+    ('tenant', pa.string()),
+    ('asset_id', pa.int32()),
+    ('event_time', pa.timestamp('us', tz='UTC')),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+    ('status_text', pa.string()),
+    ('position_description', pa.string()),
+    ('name', pa.string()),
+    ('plate_number', pa.string()),
+    ('vin', pa.string()),
+])
+
+# Sorted like the partition primary key, so per row group min/max statistics on asset_id and
+# event_time are tight and readers can skip row groups for asset or time predicates.
+# Asset attributes and status text are looked up in memory rather than joined, so the
+# partition is read in primary key order without a sort.
+EXPORT_QUERY = sql.SQL("""
+    SELECT tenant, asset_id, event_time, latitude, longitude, status_id, position_description
+    FROM {partition}
+    ORDER BY tenant, asset_id, event_time
+""")
+
+CHANGE_MARKER_SQL = """
+    SELECT r.partition_name,
+           coalesce(s.n_tup_ins, 0) || ':' || coalesce(s.n_tup_upd, 0) || ':' || coalesce(s.n_tup_del, 0)
+    FROM posts_partition_ranges r
+    LEFT JOIN pg_stat_user_tables s ON s.relname = r.partition_name
+    WHERE r.range_end <= now()
+    ORDER BY r.range_start
+"""
+
+def changed_partitions(conn, force=False):
+    """
+    Closed partitions whose write counters differ from the ones recorded at their last export,
+    as a list of (partition_name, change_marker).
+    """
+    with conn.cursor() as cur:
+        cur.execute(CHANGE_MARKER_SQL)
+        closed = cur.fetchall()
+        cur.execute("SELECT partition_name, change_marker FROM partition_exports")
+        exported = dict(cur.fetchall())
+    conn.commit()
+    return [(name, marker) for name, marker in closed if force or exported.get(name) != marker]
+
+def _to_float(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+def load_dimensions(conn):
+    """(assets, statuses) lookups: (tenant, asset_id) -> (name, plate_number, vin) and status_id -> text"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT tenant, asset_id, name, plate_number, vin FROM assets")
+        assets = {(row[0], row[1]): row[2:] for row in cur.fetchall()}
+        cur.execute("SELECT id, status_text FROM status_codes")
+        statuses = dict(cur.fetchall())
+    conn.commit()
+    return assets, statuses
+
+def _record_batch(rows, assets, statuses):
+    missing = (None, None, None)
+    rows = [
+        row[:5] + (statuses.get(row[5]), row[6]) + assets.get((row[0], row[1]), missing)
+        for row in rows
+    ]
+    columns = list(zip(*rows))
+    arrays = []
+    for index, field in enumerate(EXPORT_SCHEMA):
+        values = columns[index]
+        if field.name in ('latitude', 'longitude'):
+            values = [_to_float(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=EXPORT_SCHEMA)
+
+def export_partition(conn, partition_name, export_dir, output_format='parquet',
+                     row_group_rows=131072, compression='zstd'):
+    """
+    Stream one partition through a server-side cursor into a compressed Parquet or Arrow IPC
+    file, one row group per fetch. Writes to a temporary file and renames it on success.
+    Returns (path, row_count).
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    extension = 'parquet' if output_format == 'parquet' else 'arrow'
+    path = os.path.join(export_dir, f"{partition_name}.{extension}")
+    tmp_path = path + '.tmp'
+    query = EXPORT_QUERY.format(partition=sql.Identifier(partition_name))
+    assets, statuses = load_dimensions(conn)
+
+    if output_format == 'parquet':
+        writer = pq.ParquetWriter(tmp_path, EXPORT_SCHEMA, compression=compression)
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch]), row_group_size=row_group_rows)
+    else:
+        writer = ipc.new_file(tmp_path, EXPORT_SCHEMA, options=ipc.IpcWriteOptions(compression=compression))
+        write = writer.write_batch
+
+    row_count = 0
+    try:
+        with conn.cursor(name=f"export_{partition_name}") as cur:
+            cur.itersize = row_group_rows
+            cur.execute(query)
+            while True:
+                rows = cur.fetchmany(row_group_rows)
+                if not rows:
+                    break
+                write(_record_batch(rows, assets, statuses))
+                row_count += len(rows)
+        conn.commit()
+        writer.close()
+        os.replace(tmp_path, path)
+    except Exception:
+        conn.rollback()
+        writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logger.info(f"Exported {row_count} rows of {partition_name} to {path}")
+    return path, row_count
+
+def export_changed_partitions(conn, export_dir, output_format='parquet', row_group_rows=131072,
+                              compression='zstd', partitions=None, force=False):
+    """Export every closed partition changed since its last export (or only the named ones)."""
+    exported = 0
+    for partition_name, marker in changed_partitions(conn, force):
+        if partitions and partition_name not in partitions:
+            continue
+        try:
+            path, row_count = export_partition(
+                conn, partition_name, export_dir, output_format, row_group_rows, compression
+            )
+        except (psycopg2.Error, OSError, pa.ArrowException) as e:
+            logger.error(f"Export of {partition_name} failed: {e}")
+            continue
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO partition_exports (partition_name, change_marker, row_count, path, exported_at)
+                VALUES (%s, %s, %s, %s, now())
+                ON CONFLICT (partition_name) DO UPDATE
+                SET change_marker = EXCLUDED.change_marker,
+                    row_count = EXCLUDED.row_count,
+                    path = EXCLUDED.path,
+                    exported_at = EXCLUDED.exported_at
+            """, (partition_name, marker, row_count, path))
+        conn.commit()
+        exported += 1
+    return exported
+
+def main():
+    parser = argparse.ArgumentParser(description="Export closed posts partitions to Parquet or Arrow IPC")
+    parser.add_argument('partitions', nargs='*', help="Partition names to export (default: all changed)")
+    parser.add_argument('--format', choices=('parquet', 'arrow'), default=os.getenv('EXPORT_FORMAT', 'parquet'))
+    parser.add_argument('--dir', default=os.getenv('EXPORT_DIR', './export'))
+    parser.add_argument('--row-group-rows', type=int, default=int(os.getenv('EXPORT_ROW_GROUP_ROWS', 131072)))
+    parser.add_argument('--compression', default=os.getenv('EXPORT_COMPRESSION', 'zstd'))
+    parser.add_argument('--force', action='store_true', help="Export even if unchanged since the last export")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    conn = psycopg2.connect(
+        host=os.getenv('POSTGRES_HOST', 'db'),
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        database=os.getenv('POSTGRES_DB')
+    )
+    try:
+        exported = export_changed_partitions(
+            conn, args.dir, args.format, args.row_group_rows, args.compression, args.partitions, args.force
+        )
+        logger.info(f"Exported {exported} partitions")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import logging
+import threading
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Positions in the prepared row tuple (POSTS_COLUMNS order)
+ASSET_ID, NAME, PLATE_NUMBER, VIN, POSITION_DESCRIPTION, EVENT_TIME, LATITUDE, LONGITUDE, STATUS_TEXT, TENANT = range(10)
+
+# Columns of the narrow posts fact table, in the order position_rows() produces them
+POSITION_COLUMNS = (
+    'asset_id', 'position_description', 'event_time', 'latitude', 'longitude', 'status_id', 'tenant'
+)
+
+ASSET_UPSERT_CLAUSE = """
+    ON CONFLICT (tenant, asset_id) DO UPDATE
+    SET
+        name = EXCLUDED.name,
+        plate_number = EXCLUDED.plate_number,
+        vin = EXCLUDED.vin,
+        updated_at = now()
+    WHERE (assets.name, assets.plate_number, assets.vin)
+        IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.plate_number, EXCLUDED.vin)
+"""
+
+ASSET_COLUMNS = ('tenant', 'asset_id', 'name', 'plate_number', 'vin')
+
+def _coordinate(value):
+    return float(value) if value is not None else None
+
+class Dimensions:
+    """
+    In-memory copy of the assets dimension and the status_codes dictionary. Prepared rows are
+    split into asset attributes, upserted only when they differ from what is known to be
+    committed, and narrow position rows with the status text replaced by its small integer id.
+    Entries are only remembered once the writer's transaction has committed, so a rollback
+    never leaves the cache ahead of the database.
+    """
+
+    def __init__(self):
+        self._assets = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+
+    def warm(self, conn):
+        """Load committed assets and status codes; the schema has been checked at startup."""
+        with conn.cursor() as cur:
+            cur.execute("SELECT tenant, asset_id, name, plate_number, vin FROM assets")
+            assets = cur.fetchall()
+            cur.execute("SELECT status_text, id FROM status_codes")
+            statuses = cur.fetchall()
+        conn.commit()
+        with self._lock:
+            self._assets.update(((row[0], row[1]), row[2:]) for row in assets)
+            self._statuses.update(statuses)
+        logger.info(f"Loaded {len(assets)} assets and {len(statuses)} status codes")
+
+    def changed_assets(self, rows):
+        """Latest attributes per asset that differ from the committed ones, as assets rows."""
+        latest = {}
+        with self._lock:
+            for row in rows:
+                key = (row[TENANT], row[ASSET_ID])
+                attributes = (row[NAME], row[PLATE_NUMBER], row[VIN])
+                if self._assets.get(key) != attributes:
+                    latest[key] = key + attributes
+        return list(latest.values())
+
+    def unknown_statuses(self, rows):
+        with self._lock:
+            return list({row[STATUS_TEXT] for row in rows
+                         if row[STATUS_TEXT] is not None and row[STATUS_TEXT] not in self._statuses})
+
+    def status_ids(self, pending_statuses=None):
+        with self._lock:
+            if not pending_statuses:
+                return dict(self._statuses)
+            return {**self._statuses, **pending_statuses}
+
+    def prepare(self, cursor, rows):
+        """
+        Upsert changed assets and resolve unknown statuses in the cursor's transaction.
+        Returns (status_ids, pending) where pending is passed to remember() after commit.
+        """
+        assets = self.changed_assets(rows)
+        if assets:
+            execute_values(
+                cursor,
+                f"INSERT INTO assets ({', '.join(ASSET_COLUMNS)}) VALUES %s" + ASSET_UPSERT_CLAUSE,
+                assets
+            )
+        statuses = {}
+        unknown = self.unknown_statuses(rows)
+        if unknown:
+            cursor.execute(
+                "INSERT INTO status_codes (status_text) SELECT unnest(%s::text[]) ON CONFLICT (status_text) DO NOTHING",
+                (unknown,)
+            )
+            cursor.execute("SELECT status_text, id FROM status_codes WHERE status_text = ANY(%s)", (unknown,))
+            statuses = dict(cursor.fetchall())
+        return self.status_ids(statuses), (assets, statuses)
+
+    async def prepare_async(self, conn, rows):
+        """asyncpg variant of prepare(), run inside the writer's transaction."""
+        assets = self.changed_assets(rows)
+        if assets:
+            placeholders = ', '.join(f"${i}" for i in range(1, len(ASSET_COLUMNS) + 1))
+            await conn.executemany(
+                f"INSERT INTO assets ({', '.join(ASSET_COLUMNS)}) VALUES ({placeholders})" + ASSET_UPSERT_CLAUSE,
+                assets
+            )
+        statuses = {}
+        unknown = self.unknown_statuses(rows)
+        if unknown:
+            await conn.execute(
+                "INSERT INTO status_codes (status_text) SELECT unnest($1::text[]) ON CONFLICT (status_text) DO NOTHING",
+                unknown
+            )
+            records = await conn.fetch("SELECT status_text, id FROM status_codes WHERE status_text = ANY($1)", unknown)
+            statuses = {record['status_text']: record['id'] for record in records}
+        return self.status_ids(statuses), (assets, statuses)
+
+    def remember(self, pending):
+        """Record assets and statuses written by a transaction that has committed."""
+        assets, statuses = pending
+        with self._lock:
+            self._assets.update(((row[0], row[1]), row[2:]) for row in assets)
+            self._statuses.update(statuses)
+
+def position_rows(rows, status_ids):
+    """Narrow posts rows in POSITION_COLUMNS order for prepared rows."""
+    return [
+        (
+            row[ASSET_ID],
+            row[POSITION_DESCRIPTION],
+            row[EVENT_TIME],
+            _coordinate(row[LATITUDE]),
+            _coordinate(row[LONGITUDE]),
+            status_ids.get(row[STATUS_TEXT]),
+            row[TENANT]
+        )
+        for row in rows
+    ]
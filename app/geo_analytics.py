@@ -0,0 +1,296 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+POSITIONS_SQL = """
+    SELECT asset_id, extract(epoch FROM event_time), latitude::float8, longitude::float8
+    FROM posts
+    WHERE tenant = %(tenant)s
+      AND event_time >= %(start)s AND event_time < %(end)s
+      AND latitude IS NOT NULL AND longitude IS NOT NULL
+      {asset_filter}
+    ORDER BY asset_id, event_time
+"""
+
+def load_positions(conn, tenant, start, end, asset_ids=None):
+    """
+    Fetch [start, end) for the tenant in one query and return (asset_ids, epoch_seconds,
+    latitudes, longitudes) as NumPy arrays sorted by asset and time.
+    """
+    query = POSITIONS_SQL.format(asset_filter="AND asset_id = ANY(%(asset_ids)s)" if asset_ids else "")
+    with conn.cursor() as cur:
+        cur.execute(query, {'tenant': tenant, 'start': start, 'end': end, 'asset_ids': asset_ids})
+        rows = cur.fetchall()
+    conn.commit()
+    if not rows:
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty, empty, empty
+    data = np.array(rows, dtype=np.float64)
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2], data[:, 3]
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres, element-wise over arrays of degrees."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def _runs(mask):
+    """(start, end) index pairs of the runs of True in a boolean array, end exclusive."""
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def _isoformat(epoch_seconds):
+    """ISO 8601 UTC strings for an array of epoch seconds, formatted in one NumPy call."""
+    return np.datetime_as_string((epoch_seconds * 1e6).astype('datetime64[us]'), unit='s', timezone='UTC').tolist()
+
+def _stop(start_time, end_time, latitude, longitude):
+    stop_start, stop_end = _isoformat(np.array([start_time, end_time]))
+    return {
+        "start": stop_start,
+        "end": stop_end,
+        "duration_s": end_time - start_time,
+        "latitude": round(latitude, 6),
+        "longitude": round(longitude, 6),
+    }
+
+def compute_metrics(asset_ids, times, lats, lons, stop_speed_mps=0.5, min_stop_seconds=300):
+    """
+    Per-asset distance, durations, speeds and stops for points sorted by (asset_id, time).
+    A stop is a run of consecutive segments slower than stop_speed_mps lasting at least
+    min_stop_seconds. Returns {asset_id: metrics}.
+    """
+    return compute_piece(asset_ids, times, lats, lons, stop_speed_mps, min_stop_seconds)[0]
+
+def compute_piece(asset_ids, times, lats, lons, stop_speed_mps=0.5, min_stop_seconds=300):
+    """
+    compute_metrics() plus, per asset, the edges merge_metrics() needs to join this piece
+    with the neighbouring time ranges: first and last point, the slow runs touching them
+    and whether those runs were reported as stops. Returns ({asset_id: metrics}, {asset_id: edges}).
+    """
+    if len(asset_ids) == 0:
+        return {}, {}
+
+    # Segments join consecutive points of the same asset
+    same_asset = asset_ids[1:] == asset_ids[:-1]
+    seg_dist = np.where(same_asset, haversine_m(lats[:-1], lons[:-1], lats[1:], lons[1:]), 0.0)
+    seg_time = np.where(same_asset, times[1:] - times[:-1], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seg_speed = np.where(seg_time > 0, seg_dist / seg_time, 0.0)
+    slow = same_asset & (seg_speed < stop_speed_mps)
+    moving_time = np.where(same_asset & ~slow, seg_time, 0.0)
+
+    # Group boundaries: first point of each asset; segment i belongs to the asset of point i
+    group_starts = np.flatnonzero(np.concatenate(([True], ~same_asset)))
+    group_ends = np.concatenate((group_starts[1:], [len(asset_ids)]))
+    segment_starts = np.minimum(group_starts, max(len(seg_dist) - 1, 0))
+
+    if len(seg_dist):
+        distance = np.add.reduceat(seg_dist, segment_starts)
+        moving = np.add.reduceat(moving_time, segment_starts)
+        max_speed = np.maximum.reduceat(seg_speed, segment_starts)
+    else:
+        distance = moving = max_speed = np.zeros(len(group_starts))
+    single_point = group_ends - group_starts == 1
+    distance[single_point] = 0.0
+    moving[single_point] = 0.0
+    max_speed[single_point] = 0.0
+    duration = times[group_ends - 1] - times[group_starts]
+
+    # Stops: runs of slow segments, split at asset boundaries since those segments are never slow
+    run_starts, run_ends = _runs(slow)
+    run_duration = times[run_ends] - times[run_starts]
+    long_enough = run_duration >= min_stop_seconds
+    run_starts, run_ends, run_duration = run_starts[long_enough], run_ends[long_enough], run_duration[long_enough]
+
+    results = {}
+    for index, asset_id in enumerate(asset_ids[group_starts].tolist()):
+        results[asset_id] = {
+            "points": int(group_ends[index] - group_starts[index]),
+            "distance_m": round(float(distance[index]), 1),
+            "duration_s": float(duration[index]),
+            "moving_s": float(moving[index]),
+            "idle_s": float(duration[index] - moving[index]),
+            "max_speed_kmh": round(float(max_speed[index]) * 3.6, 1),
+            "avg_moving_speed_kmh": round(float(distance[index] / moving[index]) * 3.6, 1) if moving[index] else 0.0,
+            "stops": [],
+        }
+    stop_columns = zip(
+        asset_ids[run_starts].tolist(),
+        _isoformat(times[run_starts]),
+        _isoformat(times[run_ends]),
+        run_duration.tolist(),
+        np.round(lats[run_starts], 6).tolist(),
+        np.round(lons[run_starts], 6).tolist(),
+    )
+    for asset_id, stop_start, stop_end, seconds, latitude, longitude in stop_columns:
+        results[asset_id]["stops"].append({
+            "start": stop_start,
+            "end": stop_end,
+            "duration_s": seconds,
+            "latitude": latitude,
+            "longitude": longitude,
+        })
+
+    # Slow runs touching each asset's first / last point; segments across assets are never slow,
+    # so the run from the first point ends at the first non-slow segment (or the last point)
+    # and the run into the last point starts after the last non-slow segment (or at the first point)
+    last_points = group_ends - 1
+    not_slow = np.concatenate((np.flatnonzero(~slow), [len(asset_ids) - 1]))
+    lead_ends = np.minimum(not_slow[np.searchsorted(not_slow, group_starts)], last_points)
+    not_slow = np.concatenate(([-1], not_slow))
+    trail_starts = np.maximum(not_slow[np.searchsorted(not_slow, last_points) - 1] + 1, group_starts)
+    edge_columns = zip(
+        asset_ids[group_starts].tolist(),
+        times[group_starts].tolist(), lats[group_starts].tolist(), lons[group_starts].tolist(),
+        times[last_points].tolist(), lats[last_points].tolist(), lons[last_points].tolist(),
+        times[lead_ends].tolist(), (lead_ends > group_starts).tolist(),
+        times[trail_starts].tolist(), lats[trail_starts].tolist(), lons[trail_starts].tolist(),
+        (trail_starts < last_points).tolist(), (lead_ends == last_points).tolist(),
+    )
+    edges = {}
+    for (asset_id, first_t, first_lat, first_lon, last_t, last_lat, last_lon, lead_end, lead_run,
+         trail_t, trail_lat, trail_lon, trail_run, all_slow) in edge_columns:
+        edges[asset_id] = {
+            "first": (first_t, first_lat, first_lon),
+            "last": (last_t, last_lat, last_lon),
+            "lead_end": lead_end,
+            "lead_stop": lead_run and lead_end - first_t >= min_stop_seconds,
+            "trail_start": (trail_t, trail_lat, trail_lon),
+            "trail_stop": trail_run and last_t - trail_t >= min_stop_seconds,
+            "all_slow": all_slow,
+        }
+    return results, edges
+
+def _join(a, a_edges, b, b_edges, stop_speed_mps, min_stop_seconds):
+    """
+    Metrics and edges of one asset over two consecutive pieces, including the segment
+    between them. A slow run crossing the boundary becomes a single stop.
+    """
+    last_t, last_lat, last_lon = a_edges["last"]
+    first_t, first_lat, first_lon = b_edges["first"]
+    gap_distance = float(haversine_m(last_lat, last_lon, first_lat, first_lon))
+    gap_time = first_t - last_t
+    gap_speed = gap_distance / gap_time if gap_time > 0 else 0.0
+    slow = gap_speed < stop_speed_mps
+
+    duration = b_edges["last"][0] - a_edges["first"][0]
+    distance = a["distance_m"] + b["distance_m"] + gap_distance
+    moving = a["moving_s"] + b["moving_s"] + (0.0 if slow else gap_time)
+    edges = {
+        "first": a_edges["first"],
+        "last": b_edges["last"],
+        "lead_end": a_edges["lead_end"],
+        "lead_stop": a_edges["lead_stop"],
+        "trail_start": b_edges["trail_start"],
+        "trail_stop": b_edges["trail_stop"],
+        "all_slow": False,
+    }
+    if slow:
+        # The trailing run of a, the gap and the leading run of b are one run
+        start_t, start_lat, start_lon = a_edges["trail_start"]
+        end_t = b_edges["lead_end"]
+        is_stop = end_t - start_t >= min_stop_seconds
+        stops = a["stops"][:-1] if a_edges["trail_stop"] else list(a["stops"])
+        if is_stop:
+            stops.append(_stop(start_t, end_t, start_lat, start_lon))
+        stops.extend(b["stops"][1:] if b_edges["lead_stop"] else b["stops"])
+        if a_edges["all_slow"]:
+            edges["lead_end"], edges["lead_stop"] = end_t, is_stop
+        if b_edges["all_slow"]:
+            edges["trail_start"], edges["trail_stop"] = a_edges["trail_start"], is_stop
+        edges["all_slow"] = a_edges["all_slow"] and b_edges["all_slow"]
+    else:
+        stops = a["stops"] + b["stops"]
+
+    metrics = {
+        "points": a["points"] + b["points"],
+        "distance_m": round(distance, 1),
+        "duration_s": duration,
+        "moving_s": moving,
+        "idle_s": duration - moving,
+        "max_speed_kmh": max(a["max_speed_kmh"], b["max_speed_kmh"], round(gap_speed * 3.6, 1)),
+        "avg_moving_speed_kmh": round(distance / moving * 3.6, 1) if moving else 0.0,
+        "stops": stops,
+    }
+    return metrics, edges
+
+def merge_metrics(parts, stop_speed_mps=0.5, min_stop_seconds=300):
+    """
+    Combine the (metrics, edges) pieces of consecutive time ranges, as returned by
+    compute_piece(), into the metrics of the whole range.
+    """
+    merged = {}
+    for metrics_part, edges_part in parts:
+        for asset_id, metrics in metrics_part.items():
+            current = merged.get(asset_id)
+            if current is None:
+                merged[asset_id] = ({**metrics, "stops": list(metrics["stops"])}, edges_part[asset_id])
+            else:
+                merged[asset_id] = _join(*current, metrics, edges_part[asset_id], stop_speed_mps, min_stop_seconds)
+    return {asset_id: metrics for asset_id, (metrics, _) in merged.items()}
+
+class PartitionMetricsCache:
+    """
+    LRU of computed (metrics, edges) for closed partitions, keyed by (tenant, partition_name,
+    change marker, asset filter, stop parameters). Closed partitions still change (late rows,
+    spool replay, a partition recreated under the same name); the marker (table oid and
+    write counters, as in columnar_export) makes any such change a cache miss.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+def asset_metrics(conn, cache, tenant, start, end, asset_ids=None, stop_speed_mps=0.5, min_stop_seconds=300):
+    """
+    Metrics for [start, end), computed piecewise per partition and joined across partition
+    boundaries. Pieces that cover a whole closed partition are served from / stored in the cache.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT r.partition_name, r.range_start, r.range_end, r.range_end <= now(),
+                   coalesce(s.relid, 0) || ':' || coalesce(s.n_tup_ins, 0) || ':'
+                       || coalesce(s.n_tup_upd, 0) || ':' || coalesce(s.n_tup_del, 0)
+            FROM posts_partition_ranges r
+            LEFT JOIN pg_stat_user_tables s ON s.relname = r.partition_name
+            WHERE r.range_start < %s AND r.range_end > %s
+            ORDER BY r.range_start
+        """, (end, start))
+        partitions = cur.fetchall()
+    conn.commit()
+
+    parts = []
+    asset_key = tuple(sorted(asset_ids)) if asset_ids else None
+    for partition_name, range_start, range_end, closed, change_marker in partitions:
+        piece_start, piece_end = max(start, range_start), min(end, range_end)
+        whole_closed = closed and piece_start == range_start and piece_end == range_end
+        key = (tenant, partition_name, change_marker, asset_key, stop_speed_mps, min_stop_seconds)
+        metrics = cache.get(key) if whole_closed else None
+        if metrics is None:
+            metrics = compute_piece(
+                *load_positions(conn, tenant, piece_start, piece_end, asset_ids),
+                stop_speed_mps=stop_speed_mps, min_stop_seconds=min_stop_seconds
+            )
+            if whole_closed:
+                cache.put(key, metrics)
+        parts.append(metrics)
+    return merge_metrics(parts, stop_speed_mps, min_stop_seconds)
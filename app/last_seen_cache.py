@@ -0,0 +1,85 @@
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Prepared rows are tuples in posts column order:
+# asset_id, name, plate_number, vin, position_description, event_time, latitude, longitude, status_text, tenant
+ASSET_ID, EVENT_TIME, LATITUDE, LONGITUDE, STATUS_TEXT, TENANT = 0, 5, 6, 7, 8, 9
+
+def _coordinate(value):
+    return float(value) if value is not None else None
+
+def _fingerprint(row):
+    """Comparable tuple of the non-key columns of a prepared row"""
+    return row[1:5] + (_coordinate(row[LATITUDE]), _coordinate(row[LONGITUDE]), row[STATUS_TEXT])
+
+class LastSeenCache:
+    """
+    Bounded LRU of the last stored content per (tenant, asset_id, event_time).
+    Used to drop rows that are identical to what is already in posts.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def filter_unchanged(self, prepared_data):
+        """Return (changed_rows, skipped_count) for a list of prepared rows"""
+        if self.max_size <= 0:
+            return prepared_data, 0
+
+        changed = []
+        with self._lock:
+            for item in prepared_data:
+                key = (item[TENANT], item[ASSET_ID], item[EVENT_TIME])
+                cached = self._entries.get(key)
+                if cached is not None and cached == _fingerprint(item):
+                    self._entries.move_to_end(key)
+                    continue
+                changed.append(item)
+        return changed, len(prepared_data) - len(changed)
+
+    def mark_stored(self, prepared_data):
+        """Remember rows after they were committed to the database"""
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            for item in prepared_data:
+                key = (item[TENANT], item[ASSET_ID], item[EVENT_TIME])
+                self._entries[key] = _fingerprint(item)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def warm(self, conn, lookback_hours=24):
+        """Load the most recent rows from posts so a restart does not rewrite them"""
+        if self.max_size <= 0:
+            return 0
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT asset_id, name, plate_number, vin, position_description,
+                           event_time, latitude, longitude, status_text, tenant
+                    FROM posts_wide
+                    WHERE event_time > now() - make_interval(hours => %s)
+                    ORDER BY event_time DESC
+                    LIMIT %s
+                """, (lookback_hours, self.max_size))
+                rows = cur.fetchall()
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"Could not warm last-seen cache: {e}")
+            return 0
+
+        self.mark_stored(list(reversed(rows)))
+        logger.info(f"Warmed last-seen cache with {len(rows)} rows")
+        return len(rows)
@@ -1,24 +1,50 @@
 import requests
 import psycopg2
 from psycopg2.extras import execute_values
-from psycopg2.pool import SimpleConnectionPool
+from io import StringIO
+from psycopg2.pool import ThreadedConnectionPool
 import time
 import os
+import json
 import logging
-from datetime import datetime
-import pytz
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+import ijson
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.executors.pool import ThreadPoolExecutor
 from sqlalchemy import create_engine
 import uvicorn
 import asyncio
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse, Response
 from logging_config import setup_logging
 from log_cleanup import cleanup_old_logs
-from partition_handler import handle_missing_partition_error, create_future_partitions
+from partition_handler import (
+    handle_missing_partition_error, create_future_partitions, PartitionManager, recommend_partition_granularity
+)
+from last_seen_cache import LastSeenCache
+from token_cache import TokenCache, TokenExpiredError
+from rate_limiter import TokenBucket
+from async_pipeline import AsyncFetcher, AsyncWriter, run_polling
+from accounts import Account, DEFAULT_TENANT, load_account_configs
+from batch_writer import BatchWriter
+from spool import Spool
+from trajectory import DeadBandCompressor, RawArchive
+from retention import apply_retention
+from maintenance import run_maintenance
+from columnar_export import export_changed_partitions
+from read_api import iter_positions, iter_bbox_positions, FORMATS
+from geo_analytics import PartitionMetricsCache, asset_metrics
+from dimensions import Dimensions, POSITION_COLUMNS, position_rows
+from vehicle_latest import update_vehicle_latest, update_vehicle_latest_async, fetch_vehicle_latest
+import metrics
 
 # Configure logging
 logger = setup_logging()
@@ -31,23 +57,114 @@ POSTGRES_DB = os.getenv('POSTGRES_DB')
 API_BASE_URL = os.getenv('API_BASE_URL', 'https://api.winfleet.lu')
 API_USERNAME = os.getenv('API_USERNAME', 'your_username')
 API_PASSWORD = os.getenv('API_PASSWORD', 'your_password')
+# Optional JSON file listing several accounts to poll; overrides API_USERNAME / API_PASSWORD
+API_ACCOUNTS_FILE = os.getenv('API_ACCOUNTS_FILE')
+# Size of the worker pool the per-account fetch jobs run on
+POLL_WORKERS = int(os.getenv('POLL_WORKERS', 10))
 FETCH_INTERVAL = int(os.getenv('FETCH_INTERVAL', 60))
+# Connections reserved for API requests; streaming endpoints hold theirs for the whole response
+API_DB_CONNECTIONS = int(os.getenv('API_DB_CONNECTIONS', 10))
 API_PORT = int(os.getenv('API_PORT', 8000))
 
+# Ingest configuration: 'values' (execute_values upsert) or 'copy' (COPY into staging table + merge)
+INGEST_MODE = os.getenv('INGEST_MODE', 'values').lower()
+# Number of (asset_id, event_time) rows remembered to skip unchanged upserts; 0 disables the filter
+LAST_SEEN_CACHE_SIZE = int(os.getenv('LAST_SEEN_CACHE_SIZE', 50000))
+# Stream and parse /v1/assets/ incrementally, storing rows in fixed-size batches
+STREAM_ASSETS = os.getenv('STREAM_ASSETS', 'false').lower() == 'true'
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 5000))
+# Token lifetime used when the login response carries no expiry, and how early to refresh
+TOKEN_TTL_SECONDS = int(os.getenv('TOKEN_TTL_SECONDS', 3600))
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv('TOKEN_REFRESH_MARGIN_SECONDS', 60))
+# Run polling and ingestion as asyncio tasks on the FastAPI event loop instead of scheduler threads
+ASYNC_PIPELINE = os.getenv('ASYNC_PIPELINE', 'false').lower() == 'true'
+# Delay before the async pipeline is restarted after it stopped on an error
+ASYNC_PIPELINE_RESTART_SECONDS = float(os.getenv('ASYNC_PIPELINE_RESTART_SECONDS', 10))
+# Hand prepared batches to a dedicated writer thread through a bounded queue
+WRITER_THREAD = os.getenv('WRITER_THREAD', 'false').lower() == 'true'
+WRITE_QUEUE_MAX_BATCHES = int(os.getenv('WRITE_QUEUE_MAX_BATCHES', 100))
+WRITE_QUEUE_PUT_TIMEOUT = float(os.getenv('WRITE_QUEUE_PUT_TIMEOUT', 30))
+WRITER_FLUSH_ROWS = int(os.getenv('WRITER_FLUSH_ROWS', 5000))
+WRITER_FLUSH_INTERVAL = float(os.getenv('WRITER_FLUSH_INTERVAL', 5))
+# On-disk spool for batches that could not be stored, replayed once Postgres is back
+SPOOL_ENABLED = os.getenv('SPOOL_ENABLED', 'true').lower() == 'true'
+SPOOL_DIR = os.getenv('SPOOL_DIR', os.path.join('.', 'spool'))
+SPOOL_MAX_BYTES = int(os.getenv('SPOOL_MAX_BYTES', 512 * 1024 * 1024))
+SPOOL_SEGMENT_BYTES = int(os.getenv('SPOOL_SEGMENT_BYTES', 16 * 1024 * 1024))
+SPOOL_EVICTION = os.getenv('SPOOL_EVICTION', 'drop_oldest')
+SPOOL_REPLAY_INTERVAL = int(os.getenv('SPOOL_REPLAY_INTERVAL', 30))
+# Per-asset dead-band compression of positions before they are stored
+TRAJECTORY_COMPRESSION = os.getenv('TRAJECTORY_COMPRESSION', 'false').lower() == 'true'
+TRAJECTORY_MIN_DISTANCE_M = float(os.getenv('TRAJECTORY_MIN_DISTANCE_M', 25))
+TRAJECTORY_MIN_HEADING_DEG = float(os.getenv('TRAJECTORY_MIN_HEADING_DEG', 15))
+TRAJECTORY_MAX_GAP_SECONDS = int(os.getenv('TRAJECTORY_MAX_GAP_SECONDS', 600))
+# Directory for the uncompressed raw rows, empty to keep no raw archive
+TRAJECTORY_RAW_ARCHIVE_DIR = os.getenv('TRAJECTORY_RAW_ARCHIVE_DIR', '')
+# Raw partitions older than this many months are summarized, archived and detached; 0 disables
+RETENTION_MONTHS = int(os.getenv('RETENTION_MONTHS', 0))
+RETENTION_BUCKET_SECONDS = int(os.getenv('RETENTION_BUCKET_SECONDS', 300))
+RETENTION_ARCHIVE_DIR = os.getenv('RETENTION_ARCHIVE_DIR', os.path.join('.', 'archive'))
+RETENTION_DROP_DETACHED = os.getenv('RETENTION_DROP_DETACHED', 'true').lower() == 'true'
+# Columnar export of closed partitions (Parquet or Arrow IPC)
+EXPORT_ENABLED = os.getenv('EXPORT_ENABLED', 'false').lower() == 'true'
+EXPORT_DIR = os.getenv('EXPORT_DIR', os.path.join('.', 'export'))
+EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', 'parquet')
+EXPORT_ROW_GROUP_ROWS = int(os.getenv('EXPORT_ROW_GROUP_ROWS', 131072))
+EXPORT_COMPRESSION = os.getenv('EXPORT_COMPRESSION', 'zstd')
+# Computed trip metrics kept for closed partitions
+ANALYTICS_CACHE_ENTRIES = int(os.getenv('ANALYTICS_CACHE_ENTRIES', 256))
+# Rows per keyset page of the streaming read endpoints
+READ_API_PAGE_SIZE = int(os.getenv('READ_API_PAGE_SIZE', 5000))
+# Upper bound on the time one maintenance run may spend on VACUUM / REINDEX
+MAINTENANCE_TIME_BUDGET = int(os.getenv('MAINTENANCE_TIME_BUDGET', 600))
+# Rows with an event_time outside [now - max age, now + max future] go to posts_dead_letter
+# instead of getting a partition created for them
+EVENT_TIME_MAX_AGE_DAYS = int(os.getenv('EVENT_TIME_MAX_AGE_DAYS', 365))
+EVENT_TIME_MAX_FUTURE_HOURS = int(os.getenv('EVENT_TIME_MAX_FUTURE_HOURS', 24))
+
+# Lowest partition_config.schema_version (written by db-init/init_db.py) this code runs against
+REQUIRED_SCHEMA_VERSION = 1
+MIGRATE_COMMAND = 'docker compose exec db python3 /docker-entrypoint-initdb.d/init_db.py'
+
 # Rate limit configuration
 MAX_REQUESTS_PER_MINUTE = 4
 TARGET_REQUESTS_PER_MINUTE = 1
 MIN_INTERVAL_SECONDS = 60 // TARGET_REQUESTS_PER_MINUTE
 
-# Global state for health check, rate limiting, and backups
-last_job_success = False
-last_job_time = None
-rate_limit_wait = 0
-request_count = 0
-window_start = time.time()
-
-# Connection pool
+# Connection pool, shared by the scheduler threads, the writer thread and the API request threads.
+# Created on first use (get_db_pool), so polling and spooling never wait for the database.
 db_pool = None
+db_pool_lock = threading.Lock()
+# Seconds a single connection attempt may take before the caller falls back (e.g. to the spool)
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 5))
+
+# Scheduler, kept so rate-limited fetches can be deferred instead of sleeping
+scheduler = None
+
+# Polled accounts by tenant, each with its own session, token cache and rate limiter
+accounts = {}
+
+# Last stored content per (tenant, asset_id, event_time), used to drop unchanged rows
+last_seen_cache = LastSeenCache(LAST_SEEN_CACHE_SIZE)
+
+# Cached posts partition ranges, used to create missing partitions before inserting
+partition_manager = PartitionManager()
+
+# Committed assets attributes and status codes, so unchanged attributes are not rewritten
+dimensions = Dimensions()
+
+# Distance/speed/stop metrics per closed partition, served by /analytics/assets
+analytics_cache = PartitionMetricsCache(ANALYTICS_CACHE_ENTRIES)
+
+# Writer thread draining the bounded write queue, when WRITER_THREAD is enabled
+batch_writer = None
+
+# Durable spool for batches that failed to store, when SPOOL_ENABLED is set
+spool = None
+
+# Dead-band filter and raw archive, when TRAJECTORY_COMPRESSION is set
+trajectory_compressor = None
+raw_archive = None
 
 def create_session():
     session = requests.Session()
@@ -62,111 +179,172 @@ def create_session():
     session.mount('https://', HTTPAdapter(max_retries=retries))
     return session
 
+def create_account(config):
+    return Account(
+        tenant=config['tenant'],
+        base_url=config['base_url'],
+        username=config['username'],
+        password=config['password'],
+        session=create_session(),
+        token_cache=TokenCache(TOKEN_TTL_SECONDS, TOKEN_REFRESH_MARGIN_SECONDS),
+        rate_limiter=TokenBucket(MAX_REQUESTS_PER_MINUTE, MAX_REQUESTS_PER_MINUTE / 60)
+    )
+
+def db_pool_size():
+    """
+    Connections the pool must allow: one per scheduler worker, the writer thread,
+    the spool replay job and the connections reserved for API requests.
+    """
+    return POLL_WORKERS + (1 if WRITER_THREAD else 0) + (1 if SPOOL_ENABLED else 0) + API_DB_CONNECTIONS
+
 def init_db():
+    """
+    One attempt at creating the connection pool. Raises psycopg2.OperationalError while the
+    database is unreachable; callers treat that like any other write failure and retry later.
+    """
+    if not all([POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DB]):
+        raise ValueError("Missing required database environment variables")
+
+    logger.info(f"Initializing database connection pool: host={POSTGRES_HOST}, user={POSTGRES_USER}, database={POSTGRES_DB}")
+    pool = ThreadedConnectionPool(
+        minconn=1,
+        maxconn=db_pool_size(),
+        host=POSTGRES_HOST,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        database=POSTGRES_DB,
+        connect_timeout=DB_CONNECT_TIMEOUT
+    )
+    logger.info("Database connection pool initialized successfully")
+    return pool
+
+def get_db_pool():
+    """
+    The connection pool, created on first use. Before it is handed out the schema version
+    is checked and the in-memory caches are warmed from the database.
+    """
     global db_pool
-    max_attempts = 30
-    attempt = 0
-    while attempt < max_attempts:
-        try:
-            if not all([POSTGRES_HOST, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DB]):
-                raise ValueError("Missing required database environment variables")
-                
-            logger.info(f"Initializing database connection pool: host={POSTGRES_HOST}, user={POSTGRES_USER}, database={POSTGRES_DB}")
-            db_pool = SimpleConnectionPool(
-                minconn=1,
-                maxconn=10,
-                host=POSTGRES_HOST,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD,
-                database=POSTGRES_DB
-            )
-            logger.info("Database connection pool initialized successfully")
-            return
-        except psycopg2.OperationalError as e:
-            attempt += 1
-            if attempt < max_attempts:
-                wait_time = min(2 ** attempt, 30)
-                logger.warning(f"Database connection attempt {attempt}/{max_attempts} failed. Waiting {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                logger.error(f"Failed to initialize database connection pool after {max_attempts} attempts: {e}")
+    if db_pool is not None:
+        return db_pool
+    with db_pool_lock:
+        if db_pool is None:
+            pool = init_db()
+            conn = pool.getconn()
+            try:
+                check_schema_version(conn)
+                last_seen_cache.warm(conn)
+                dimensions.warm(conn)
+                pool.putconn(conn)
+            except Exception:
+                pool.closeall()
                 raise
-        except Exception as e:
-            logger.error(f"Failed to initialize database connection pool: {e}")
-            raise
+            db_pool = pool
+    return db_pool
 
-def check_rate_limits(response):
-    global rate_limit_wait, request_count, window_start
-    current_time = time.time()
-    
-    if current_time - window_start >= 60:
-        request_count = 0
-        window_start = current_time
-    
-    request_count += 1
-    
-    if request_count > 1:
-        time.sleep(15)
-    
-    if request_count >= MAX_REQUESTS_PER_MINUTE:
-        wait_time = 60 - (current_time - window_start)
-        if wait_time > 0:
-            logger.warning(f"Approaching rate limit. Waiting {wait_time:.2f} seconds")
-            time.sleep(wait_time)
-            window_start = time.time()
-            request_count = 0
-
-    return rate_limit_wait
+def check_schema_version(conn):
+    """
+    Fail fast when the database has not been migrated. init_db.py only runs automatically
+    on an empty volume; without this check writes would fail on missing tables and every
+    batch would silently end up in the spool.
+    """
+    version = None
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('partition_config') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("SELECT value FROM partition_config WHERE key = 'schema_version'")
+            row = cur.fetchone()
+            version = row[0] if row else None
+    conn.commit()
+    if version is None or int(version) < REQUIRED_SCHEMA_VERSION:
+        message = (f"Database schema version {version or 'missing'}, {REQUIRED_SCHEMA_VERSION} required. "
+                   f"Migrate it with: {MIGRATE_COMMAND}")
+        logger.error(message)
+        raise RuntimeError(message)
+    logger.info(f"Database schema version {version}")
 
-def get_access_token(session):
+def get_access_token(account):
     """Authenticate with Winfleet API and retrieve an access token."""
-    login_url = f"{API_BASE_URL}/login"
+    login_url = f"{account.base_url}/login"
     payload = {
-        "username": API_USERNAME,
-        "password": API_PASSWORD
+        "username": account.username,
+        "password": account.password
     }
     headers = {
         "Content-Type": "application/json"
     }
     
+    started = time.perf_counter()
+    outcome = 'error'
     try:
-        response = session.post(login_url, json=payload, headers=headers)
+        response = account.session.post(login_url, json=payload, headers=headers)
         response.raise_for_status()
-        check_rate_limits(response)
-        token_data = response.json()
-        return token_data.get("token") or token_data.get("access_token")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Authentication failed: {e}")
+        token = account.token_cache.store(response.json())
+        outcome = 'ok'
+        return token
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Authentication failed for {account.tenant}: {e}")
         return None
+    finally:
+        metrics.LOGIN_SECONDS.labels(account.tenant, outcome).observe(time.perf_counter() - started)
+
+def get_cached_token(account, force_refresh=False):
+    """Return the cached access token, logging in only when it is missing, stale or rejected."""
+    if force_refresh:
+        account.token_cache.invalidate()
+    token = account.token_cache.get()
+    if token:
+        return token
+    logger.info(f"Access token for {account.tenant} missing or about to expire, logging in")
+    return get_access_token(account)
 
-def get_assets(session, token):
-    assets_url = f"{API_BASE_URL}/v1/assets/"
+def get_assets(account, token):
+    assets_url = f"{account.base_url}/v1/assets/"
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
     
+    started = time.perf_counter()
+    outcome = 'error'
     try:
-        response = session.get(assets_url, headers=headers)
+        response = account.session.get(assets_url, headers=headers)
+        if response.status_code == 401:
+            outcome = 'unauthorized'
+            raise TokenExpiredError(f"401 from {assets_url}")
         response.raise_for_status()
-        check_rate_limits(response)
+        metrics.GET_ASSETS_BYTES.labels(account.tenant).observe(len(response.content))
         assets_data = response.json()
+        outcome = 'ok'
         logger.debug(f"Raw assets data: {assets_data}")
         return assets_data
     except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to retrieve assets data: {e}")
+        logger.error(f"Failed to retrieve assets data for {account.tenant}: {e}")
         return None
+    finally:
+        metrics.GET_ASSETS_SECONDS.labels(account.tenant, outcome).observe(time.perf_counter() - started)
 
-def prepare_vehicle_status_data(json_data):
+@lru_cache(maxsize=8192)
+def parse_tx_datetime(value):
     """
-    Prepares vehicle status data for database insertion.
+    Parse a txDateTime string of the fixed form YYYY-MM-DDTHH:MM:SSZ into an aware UTC datetime.
+    Avoids strptime's locale and regex machinery; repeated strings are served from the cache.
+    """
+    if len(value) != 20 or value[4] != '-' or value[7] != '-' or value[10] != 'T' \
+            or value[13] != ':' or value[16] != ':' or value[19] != 'Z':
+        raise ValueError(f"time data {value!r} does not match format '%Y-%m-%dT%H:%M:%SZ'")
+    return datetime(
+        int(value[0:4]), int(value[5:7]), int(value[8:10]),
+        int(value[11:13]), int(value[14:16]), int(value[17:19]),
+        tzinfo=timezone.utc
+    )
+
+def iter_vehicle_status_data(vehicles, tenant=DEFAULT_TENANT):
+    """
+    Yields vehicle status rows one at a time from an iterable of assets.
     Only includes status records with id:0 and id:1 from each asset's statusList.
+    Rows are plain tuples in POSTS_COLUMNS order so they can go straight to the writer.
     """
-    prepared_data = []
-    utc = pytz.UTC
-    seen_keys = set()
-    
-    for vehicle in json_data:
+    for vehicle in vehicles:
         try:
             required_fields = ['id', 'name', 'statusList']  # Made plateNumber and vin optional
             missing_fields = [field for field in required_fields if field not in vehicle or vehicle[field] is None]
@@ -174,13 +352,11 @@ def prepare_vehicle_status_data(json_data):
                 logger.error(f"Vehicle missing required fields {missing_fields}: {vehicle}")
                 continue
                 
-            base_data = {
-                'asset_id': vehicle['id'],
-                'name': vehicle['name'],
-                'plate_number': vehicle.get('plateNumber', ''),  # Fixed syntax error, made optional
-                'vin': vehicle.get('vin', '')  # Made optional
-            }
-            
+            asset_id = vehicle['id']
+            name = vehicle['name']
+            plate_number = vehicle.get('plateNumber', '')  # Made optional
+            vin = vehicle.get('vin', '')  # Made optional
+
             if not isinstance(vehicle['statusList'], list):
                 logger.error(f"Invalid statusList for vehicle {vehicle['id']}: {vehicle['statusList']}")
                 continue
@@ -192,31 +368,30 @@ def prepare_vehicle_status_data(json_data):
                             logger.error(f"Status missing required fields for vehicle {vehicle['id']}: {status}")
                             continue
                             
-                        if not all(key in status['position'] for key in ['txDateTime', 'description', 'coordinates']):
-                            logger.error(f"Position missing required fields for vehicle {vehicle['id']}: {status['position']}")
-                            continue
-                            
-                        if not all(key in status['position']['coordinates'] for key in ['latitude', 'longitude']):
-                            logger.error(f"Coordinates missing required fields for vehicle {vehicle['id']}: {status['position']['coordinates']}")
+                        position = status['position']
+                        if not all(key in position for key in ['txDateTime', 'description', 'coordinates']):
+                            logger.error(f"Position missing required fields for vehicle {vehicle['id']}: {position}")
                             continue
 
-                        naive_event_time = datetime.strptime(status['position']['txDateTime'], '%Y-%m-%dT%H:%M:%SZ')
-                        event_time = utc.localize(naive_event_time)
-                        
-                        unique_key = (vehicle['id'], event_time)
-                        if unique_key in seen_keys:
-                            logger.warning(f"Duplicate entry for asset_id {vehicle['id']} at {event_time}")
+                        coordinates = position['coordinates']
+                        if not all(key in coordinates for key in ['latitude', 'longitude']):
+                            logger.error(f"Coordinates missing required fields for vehicle {vehicle['id']}: {coordinates}")
                             continue
-                        seen_keys.add(unique_key)
-                        
-                        prepared_data.append({
-                            **base_data,
-                            'position_description': status['position']['description'],
-                            'event_time': event_time,
-                            'latitude': status['position']['coordinates']['latitude'],
-                            'longitude': status['position']['coordinates']['longitude'],
-                            'status_text': status['statusText']
-                        })
+
+                        event_time = parse_tx_datetime(position['txDateTime'])
+
+                        yield (
+                            asset_id,
+                            name,
+                            plate_number,
+                            vin,
+                            position['description'],
+                            event_time,
+                            coordinates['latitude'],
+                            coordinates['longitude'],
+                            status['statusText'],
+                            tenant
+                        )
                     except (KeyError, ValueError) as e:
                         logger.error(f"Error preparing status data for vehicle {vehicle['id']}: {e}")
                         logger.error(f"Problematic status data: {status}")
@@ -226,143 +401,408 @@ def prepare_vehicle_status_data(json_data):
             logger.error(f"Problematic vehicle data: {vehicle}")
             continue
 
+def iter_assets(account, token):
+    """
+    Streams the /v1/assets/ response and yields one vehicle at a time
+    without holding the raw body or the full parsed list in memory.
+    """
+    assets_url = f"{account.base_url}/v1/assets/"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+
+    started = time.perf_counter()
+    with account.session.get(assets_url, headers=headers, stream=True) as response:
+        outcome = 'ok' if response.ok else 'unauthorized' if response.status_code == 401 else 'error'
+        metrics.GET_ASSETS_SECONDS.labels(account.tenant, outcome).observe(time.perf_counter() - started)
+        if response.status_code == 401:
+            raise TokenExpiredError(f"401 from {assets_url}")
+        response.raise_for_status()
+        response.raw.decode_content = True
+        yield from ijson.items(response.raw, 'item', use_float=True)
+        # Bytes pulled over the wire, before content decoding
+        metrics.GET_ASSETS_BYTES.labels(account.tenant).observe(response.raw.tell())
+
+def prepare_vehicle_status_data(json_data, tenant=DEFAULT_TENANT):
+    """
+    Prepares vehicle status data for database insertion.
+    Only includes status records with id:0 and id:1 from each asset's statusList.
+    """
+    started = time.perf_counter()
+    prepared_data = []
+    seen_keys = set()
+
+    for item in iter_vehicle_status_data(json_data, tenant):
+        unique_key = (item[0], item[5])
+        if unique_key in seen_keys:
+            logger.warning(f"Duplicate entry for asset_id {item[0]} at {item[5]}")
+            continue
+        seen_keys.add(unique_key)
+        prepared_data.append(item)
+
+    metrics.PREPARE_SECONDS.labels(tenant).observe(time.perf_counter() - started)
+    metrics.PREPARED_ROWS.labels(tenant).observe(len(prepared_data))
     logger.info(f"Prepared {len(prepared_data)} records from {len(json_data)} vehicles")
     return prepared_data
 
+def iter_batches(rows, batch_size):
+    """
+    Groups a row iterator into lists of at most batch_size rows,
+    dropping duplicate (asset_id, event_time) keys within a batch.
+    """
+    batch = []
+    seen_keys = set()
+    for item in rows:
+        unique_key = (item[0], item[5])
+        if unique_key in seen_keys:
+            logger.warning(f"Duplicate entry for asset_id {item[0]} at {item[5]}")
+            continue
+        seen_keys.add(unique_key)
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+            seen_keys = set()
+    if batch:
+        yield batch
+
+POSTS_COLUMNS = (
+    'asset_id', 'name', 'plate_number', 'vin', 'position_description',
+    'event_time', 'latitude', 'longitude', 'status_text', 'tenant'
+)
+
+# posts only holds the per-position columns; name, plate_number and vin live in assets
+# and status_text is dictionary-encoded in status_codes (see dimensions.py)
+UPSERT_CONFLICT_CLAUSE = """
+    ON CONFLICT ON CONSTRAINT posts_pkey DO UPDATE
+    SET
+        position_description = EXCLUDED.position_description,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        status_id = EXCLUDED.status_id
+    WHERE (
+        posts.position_description, posts.latitude, posts.longitude, posts.status_id
+    ) IS DISTINCT FROM (
+        EXCLUDED.position_description, EXCLUDED.latitude, EXCLUDED.longitude, EXCLUDED.status_id
+    )
+"""
+
+def upsert_values(cursor, values, status_ids):
+    """Upsert prepared row tuples into posts with a single multi-row INSERT."""
+    execute_values(
+        cursor,
+        f"INSERT INTO posts ({', '.join(POSITION_COLUMNS)}) VALUES %s" + UPSERT_CONFLICT_CLAUSE,
+        position_rows(values, status_ids)
+    )
+
+def _copy_text_field(value):
+    """Encode a single value for COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+def upsert_copy(cursor, values, status_ids):
+    """
+    Stream prepared row tuples into a temporary staging table with COPY FROM STDIN,
+    then merge them into posts with one set-based INSERT ... SELECT.
+    """
+    columns = ', '.join(POSITION_COLUMNS)
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS posts_staging (
+            asset_id INTEGER,
+            position_description TEXT,
+            event_time TIMESTAMPTZ,
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION,
+            status_id SMALLINT,
+            tenant TEXT
+        ) ON COMMIT DELETE ROWS
+    """)
+    buffer = StringIO()
+    for row in position_rows(values, status_ids):
+        buffer.write('\t'.join(_copy_text_field(v) for v in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY posts_staging ({columns}) FROM STDIN", buffer)
+    cursor.execute(
+        f"INSERT INTO posts ({columns}) SELECT {columns} FROM posts_staging" + UPSERT_CONFLICT_CLAUSE
+    )
+
+def isolate_bad_rows(cursor, values, bad_rows, status_ids):
+    """
+    Upsert values inside a savepoint; on failure split the batch in half and
+    recurse, so k bad rows among n cost about O(k log n) statements.
+    Rows that fail on their own are appended to bad_rows as (row, error).
+    """
+    if not values:
+        return
+    cursor.execute("SAVEPOINT batch_split")
+    try:
+        upsert_values(cursor, values, status_ids)
+        cursor.execute("RELEASE SAVEPOINT batch_split")
+        return
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT batch_split")
+        cursor.execute("RELEASE SAVEPOINT batch_split")
+        if len(values) == 1:
+            logger.error(f"Error storing row with asset_id {values[0][0]}: {e}")
+            bad_rows.append((values[0], str(e).strip()))
+            return
+
+    middle = len(values) // 2
+    isolate_bad_rows(cursor, values[:middle], bad_rows, status_ids)
+    isolate_bad_rows(cursor, values[middle:], bad_rows, status_ids)
+
+def store_dead_letters(cursor, bad_rows):
+    """Park rows that could not be stored in posts_dead_letter for later inspection."""
+    execute_values(
+        cursor,
+        "INSERT INTO posts_dead_letter (asset_id, event_time, payload, error) VALUES %s",
+        [
+            (row[0], row[5], json.dumps(dict(zip(POSTS_COLUMNS, row)), default=str), error)
+            for row, error in bad_rows
+        ]
+    )
+
+def split_by_event_window(rows):
+    """
+    Split rows into (accepted, rejected) by event_time, rejected as (row, error) pairs for
+    posts_dead_letter, so one bad device timestamp never creates partitions far in the past or future.
+    """
+    now = datetime.now(timezone.utc)
+    earliest = now - timedelta(days=EVENT_TIME_MAX_AGE_DAYS)
+    # Ranges retired by retention are summarized and archived; create_posts_partition() refuses them too
+    retired_before = partition_manager.retired_before
+    if retired_before is not None and retired_before > earliest:
+        earliest = retired_before
+    latest = now + timedelta(hours=EVENT_TIME_MAX_FUTURE_HOURS)
+    accepted, rejected = [], []
+    for row in rows:
+        if earliest <= row[5] <= latest:
+            accepted.append(row)
+        else:
+            rejected.append((row, f"event_time outside accepted window {earliest.isoformat()} - {latest.isoformat()}"))
+    if rejected:
+        logger.warning(f"Rejected {len(rejected)} rows with event_time outside the accepted window")
+    return accepted, rejected
+
+def ensure_batch_partitions(conn, values):
+    """Create the partitions the batch's event_time values fall into before it is inserted."""
+    if values and not partition_manager.ensure_timestamps(conn, [row[5] for row in values]):
+        logger.warning("Could not pre-create all partitions for batch")
+
+def ensure_partitions_for_rows(rows):
+    """Pooled-connection variant of ensure_batch_partitions for writers without a psycopg2 connection."""
+    if not rows:
+        return
+    conn = get_db_pool().getconn()
+    try:
+        ensure_batch_partitions(conn, rows)
+    finally:
+        db_pool.putconn(conn)
+
+async def ensure_partitions_async(rows):
+    """
+    Event-loop variant for the async writer: the cached ranges are checked without a
+    connection or lock, and only a gap (or an unloaded cache) goes to a worker thread.
+    """
+    if not rows or partition_manager.covers([row[5] for row in rows]):
+        return
+    await asyncio.get_running_loop().run_in_executor(None, ensure_partitions_for_rows, rows)
+
 def store_vehicle_status_data(prepared_data):
-    """Store prepared vehicle status data in the database."""
+    """Store prepared vehicle status rows (tuples in POSTS_COLUMNS order) in the database."""
     if not prepared_data:
         logger.info("No data to store")
         return True
 
-    conn = db_pool.getconn()
+    values, rejected = split_by_event_window(prepared_data)
     try:
+        conn = get_db_pool().getconn()
+    except (psycopg2.Error, RuntimeError) as e:
+        logger.error(f"Could not get a database connection: {e}")
+        return False
+    started = time.perf_counter()
+    try:
+        ensure_batch_partitions(conn, values)
         with conn.cursor() as cursor:
-            values = [
-                (
-                    item['asset_id'],
-                    item['name'],
-                    item['plate_number'],
-                    item['vin'],
-                    item['position_description'],
-                    item['event_time'],
-                    item['latitude'],
-                    item['longitude'],
-                    item['status_text']
-                )
-                for item in prepared_data
-            ]
-
             try:
-                execute_values(
-                    cursor,
-                    """
-                    INSERT INTO posts (
-                        asset_id, name, plate_number, vin, position_description,
-                        event_time, latitude, longitude, status_text
-                    )
-                    VALUES %s
-                    ON CONFLICT ON CONSTRAINT posts_pkey DO UPDATE
-                    SET
-                        name = EXCLUDED.name,
-                        plate_number = EXCLUDED.plate_number,
-                        vin = EXCLUDED.vin,
-                        position_description = EXCLUDED.position_description,
-                        latitude = EXCLUDED.latitude,
-                        longitude = EXCLUDED.longitude,
-                        status_text = EXCLUDED.status_text
-                    """,
-                    values
-                )
+                status_ids, pending = dimensions.prepare(cursor, values)
+                if values:
+                    if INGEST_MODE == 'copy':
+                        upsert_copy(cursor, values, status_ids)
+                    else:
+                        upsert_values(cursor, values, status_ids)
+                update_vehicle_latest(cursor, values, status_ids)
+                if rejected:
+                    store_dead_letters(cursor, rejected)
                 conn.commit()
-                logger.info(f"Inserted/Updated {len(values)} vehicle status records in batch")
+                metrics.DEAD_LETTER_ROWS.inc(len(rejected))
+                dimensions.remember(pending)
+                metrics.observe_write(INGEST_MODE, len(values), time.perf_counter() - started)
+                logger.info(f"Inserted/Updated {len(values)} vehicle status records in batch ({INGEST_MODE})")
                 return True
-            except psycopg2.Error as e:
-                conn.rollback()
-                logger.warning(f"Batch insert failed: {e}. Falling back to row-by-row processing")
-                
-                failed_rows = []
-                for i, item in enumerate(prepared_data):
-                    try:
-                        cursor.execute(
-                            """
-                            INSERT INTO posts (
-                                asset_id, name, plate_number, vin, position_description,
-                                event_time, latitude, longitude, status_text
-                            )
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT ON CONSTRAINT posts_pkey DO UPDATE
-                            SET
-                                name = EXCLUDED.name,
-                                plate_number = EXCLUDED.plate_number,
-                                vin = EXCLUDED.vin,
-                                position_description = EXCLUDED.position_description,
-                                latitude = EXCLUDED.latitude,
-                                longitude = EXCLUDED.longitude,
-                                status_text = EXCLUDED.status_text
-                            """,
-                            (
-                                item['asset_id'],
-                                item['name'],
-                                item['plate_number'],
-                                item['vin'],
-                                item['position_description'],
-                                item['event_time'],
-                                item['latitude'],
-                                item['longitude'],
-                                item['status_text']
-                            )
-                        )
-                        conn.commit()
-                    except psycopg2.Error as row_e:
-                        conn.rollback()
-                        logger.error(f"Error storing row {i+1} with asset_id {item['asset_id']}: {row_e}")
-                        logger.error(f"Problematic row data: {item}")
-                        failed_rows.append(item)
-                    except Exception as row_e:
-                        conn.rollback()
-                        logger.error(f"Unexpected error storing row {i+1} with asset_id {item['asset_id']}: {row_e}")
-                        logger.error(f"Problematic row data: {item}")
-                        failed_rows.append(item)
-
-                if failed_rows:
-                    logger.warning(f"Failed to store {len(failed_rows)} rows out of {len(prepared_data)}")
-                    return False
-                logger.info(f"Successfully stored {len(prepared_data)} rows individually")
-                return True
-
             except psycopg2.Error as e:
                 conn.rollback()
                 if "no partition of relation" in str(e):
+                    metrics.WRITE_FALLBACKS.labels('missing_partition').inc()
+                    partition_manager.invalidate()
                     if handle_missing_partition_error(conn, str(e)):
                         return store_vehicle_status_data(prepared_data)
-                logger.error(f"Database error while storing data: {e}")
-                return False
+                metrics.WRITE_FALLBACKS.labels('savepoint_split').inc()
+                logger.warning(f"Batch insert failed: {e}. Isolating bad rows with savepoints")
+
+                bad_rows = []
+                status_ids, pending = dimensions.prepare(cursor, values)
+                isolate_bad_rows(cursor, values, bad_rows, status_ids)
+                if bad_rows:
+                    bad_ids = {id(row) for row, _ in bad_rows}
+                    update_vehicle_latest(cursor, [row for row in values if id(row) not in bad_ids], status_ids)
+                else:
+                    update_vehicle_latest(cursor, values, status_ids)
+                if bad_rows or rejected:
+                    store_dead_letters(cursor, bad_rows + rejected)
+                conn.commit()
+                dimensions.remember(pending)
+                metrics.DEAD_LETTER_ROWS.inc(len(bad_rows) + len(rejected))
+                metrics.observe_write('savepoint_split', len(values) - len(bad_rows), time.perf_counter() - started)
+
+                if bad_rows:
+                    logger.warning(f"Moved {len(bad_rows)} of {len(values)} rows to posts_dead_letter")
+                else:
+                    logger.info(f"Successfully stored {len(values)} rows after batch split")
+                return True
     except Exception as e:
         logger.error(f"Unexpected error while storing data: {e}")
-        conn.rollback()
+        rollback_quietly(conn)
         return False
     finally:
         db_pool.putconn(conn)
 
-def fetch_and_store(session):
-    global last_job_success, last_job_time, rate_limit_wait
-    if rate_limit_wait > 0:
-        logger.info(f"Rate limit wait active: {rate_limit_wait} seconds remaining")
-        time.sleep(rate_limit_wait)
-        rate_limit_wait = 0
+def rollback_quietly(conn):
+    """Roll back, tolerating a connection that died mid-transaction (the pool discards closed ones)."""
+    try:
+        conn.rollback()
+    except psycopg2.Error as e:
+        logger.error(f"Rollback failed, connection is unusable: {e}")
+
+def posts_row_key(row):
+    return (row[9], row[0], row[5])
+
+def spool_rows(rows):
+    """Keep rows that could not be stored on disk for later replay. Returns True if spooled."""
+    if spool is None:
+        logger.error(f"Spool disabled, {len(rows)} rows are lost")
+        return False
+    metrics.WRITE_FALLBACKS.labels('spool').inc()
+    return spool.append(rows)
+
+def replay_spool():
+    """Drain spooled batches into posts once the database accepts writes again."""
+    if spool is None or not spool.has_backlog():
+        return
+    replayed = spool.replay(store_vehicle_status_data, posts_row_key)
+    logger.info(f"Replayed {replayed} spooled rows")
+
+def compress_rows(rows):
+    """Archive raw rows if configured and drop the ones inside the per-asset dead band."""
+    if trajectory_compressor is None or not rows:
+        return rows
+    if raw_archive:
+        raw_archive.append(rows)
+    kept = trajectory_compressor.filter(rows)
+    if len(kept) < len(rows):
+        logger.info(f"Trajectory compression dropped {len(rows) - len(kept)} of {len(rows)} rows")
+    return kept
+
+def write_rows(rows):
+    """
+    Hand rows to the writer thread when enabled, otherwise store them synchronously.
+    With the writer thread True only means queued; /health reports the flush outcome.
+    """
+    if batch_writer:
+        return batch_writer.submit(rows)
+    if store_vehicle_status_data(rows):
+        last_seen_cache.mark_stored(rows)
+        return True
+    return False
+
+def stream_and_store(account, token):
+    """Stream assets from the API and store them batch by batch. Returns True on success."""
+    stored = 0
+    skipped_total = 0
+    try:
+        rows = iter_vehicle_status_data(iter_assets(account, token), account.tenant)
+        for batch in iter_batches(rows, STREAM_BATCH_SIZE):
+            batch, skipped = last_seen_cache.filter_unchanged(compress_rows(batch))
+            skipped_total += skipped
+            if not write_rows(batch):
+                if not spool_rows(batch):
+                    return False
+            stored += len(batch)
+    except TokenExpiredError:
+        logger.warning(f"Access token for {account.tenant} rejected while streaming assets, discarding cached token")
+        account.token_cache.invalidate()
+        return False
+    except (requests.exceptions.RequestException, ijson.JSONError) as e:
+        logger.error(f"Failed to stream assets data for {account.tenant}: {e}")
+        return False
+    finally:
+        account.record_skipped(skipped_total)
+
+    logger.info(f"Streamed and stored {stored} records for {account.tenant}, skipped {skipped_total} unchanged")
+    return True
+
+def defer_fetch(tenant, delay):
+    """Schedule a one-off fetch_and_store run once the rate limiter has capacity again."""
+    if scheduler is None:
+        logger.warning(f"Rate limit reached for {tenant} and no scheduler available, skipping fetch")
+        return
+    run_date = datetime.now() + timedelta(seconds=delay)
+    scheduler.add_job(
+        fetch_and_store,
+        trigger=DateTrigger(run_date=run_date),
+        args=[tenant],
+        id=f'fetch_job_deferred_{tenant}',
+        name=f'Deferred fetch for {tenant} after rate limit',
+        replace_existing=True
+    )
+    logger.warning(f"Rate limit reached for {tenant}. Fetch deferred by {delay:.2f} seconds")
+
+def reserve_request_slot(account):
+    """Take a token for one data request, or defer the fetch job if none is available."""
+    if account.rate_limiter.try_acquire():
+        metrics.RATE_LIMIT_WAIT_SECONDS.labels(account.tenant).observe(0)
+        return True
+    delay = account.rate_limiter.time_until_available()
+    metrics.RATE_LIMIT_WAIT_SECONDS.labels(account.tenant).observe(delay)
+    defer_fetch(account.tenant, delay)
+    return False
+
+def fetch_and_store(tenant):
+    account = accounts[tenant]
 
     attempts = 0
     max_attempts = 3
     success = False
     assets_data = None
+    unstored_rows = None
     
     while attempts < max_attempts and not success:
         attempts += 1
-        logger.info(f"Attempt {attempts} of {max_attempts}")
+        logger.info(f"Attempt {attempts} of {max_attempts} for {tenant}")
         try:
             if assets_data is None:
-                token = get_access_token(session)
+                token = get_cached_token(account)
                 if not token:
                     logger.error("Failed to obtain access token")
                     if attempts < max_attempts:
@@ -371,7 +811,29 @@ def fetch_and_store(session):
                         time.sleep(wait_time)
                     continue
 
-                assets_data = get_assets(session, token)
+                if not reserve_request_slot(account):
+                    return
+
+                if STREAM_ASSETS:
+                    if stream_and_store(account, token):
+                        success = True
+                        account.record_result(True, datetime.now())
+                    else:
+                        logger.error("Failed to stream and store assets data")
+                        if attempts < max_attempts:
+                            wait_time = 2 ** attempts
+                            logger.info(f"Waiting {wait_time} seconds before retry")
+                            time.sleep(wait_time)
+                    continue
+
+                try:
+                    assets_data = get_assets(account, token)
+                except TokenExpiredError:
+                    logger.warning(f"Access token for {tenant} rejected, logging in again")
+                    token = get_cached_token(account, force_refresh=True)
+                    if not reserve_request_slot(account):
+                        return
+                    assets_data = get_assets(account, token) if token else None
                 if not assets_data:
                     logger.error("Failed to fetch assets data")
                     if attempts < max_attempts:
@@ -381,16 +843,23 @@ def fetch_and_store(session):
                     continue
 
             if assets_data:
-                prepared_data = prepare_vehicle_status_data(assets_data)
+                prepared_data = compress_rows(prepare_vehicle_status_data(assets_data, tenant))
                 if not prepared_data:
                     logger.info("No valid data to store after preparation")
                     success = True
                     break
 
-                if store_vehicle_status_data(prepared_data):
+                prepared_data, skipped = last_seen_cache.filter_unchanged(prepared_data)
+                account.record_skipped(skipped)
+                if skipped:
+                    logger.info(f"Skipped {skipped} unchanged records")
+
+                # Set before writing so rows are spooled even if the writer raises
+                unstored_rows = prepared_data
+                if write_rows(prepared_data):
                     success = True
-                    last_job_success = True
-                    last_job_time = datetime.now()
+                    unstored_rows = None
+                    account.record_result(True, datetime.now())
                 else:
                     logger.error("Failed to store data")
                     if attempts < max_attempts:
@@ -399,7 +868,7 @@ def fetch_and_store(session):
                         time.sleep(wait_time)
 
         except Exception as e:
-            logger.error(f"Unexpected error in fetch_and_store: {e}")
+            logger.error(f"Unexpected error in fetch_and_store for {tenant}: {e}")
             logger.error(f"Assets data at time of error: {assets_data}")
             if attempts < max_attempts:
                 wait_time = 2 ** attempts
@@ -407,19 +876,69 @@ def fetch_and_store(session):
                 time.sleep(wait_time)
     
     if not success:
-        logger.warning(f"All {max_attempts} attempts failed. Will try again at next scheduled interval")
-        last_job_success = False
-        last_job_time = datetime.now()
+        if unstored_rows and spool_rows(unstored_rows):
+            logger.warning(f"Spooled {len(unstored_rows)} rows for {tenant} after {max_attempts} failed attempts")
+        logger.warning(f"All {max_attempts} attempts failed for {tenant}. Will try again at next scheduled interval")
+        account.record_result(False, datetime.now())
+
+def create_future_partitions_job():
+    conn = get_db_pool().getconn()
+    try:
+        create_future_partitions(conn, partition_manager)
+        recommendation, rows_per_day = recommend_partition_granularity(conn)
+        if recommendation != partition_manager.granularity:
+            logger.warning(
+                f"Observed {rows_per_day:.0f} rows/day: {recommendation} partitions recommended, "
+                f"{partition_manager.granularity} configured (partition_config.granularity)"
+            )
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error(f"Partition sizing check failed: {e}")
+    finally:
+        db_pool.putconn(conn)
+
+def export_job():
+    conn = get_db_pool().getconn()
+    try:
+        exported = export_changed_partitions(
+            conn, EXPORT_DIR, EXPORT_FORMAT, EXPORT_ROW_GROUP_ROWS, EXPORT_COMPRESSION
+        )
+        logger.info(f"Exported {exported} changed partitions to {EXPORT_DIR}")
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error(f"Export job failed: {e}")
+    finally:
+        db_pool.putconn(conn)
+
+def retention_job():
+    if EXPORT_ENABLED:
+        # Export before partitions are summarized and detached
+        export_job()
+    conn = get_db_pool().getconn()
+    try:
+        processed = apply_retention(
+            conn,
+            RETENTION_MONTHS,
+            RETENTION_BUCKET_SECONDS,
+            RETENTION_ARCHIVE_DIR,
+            RETENTION_DROP_DETACHED
+        )
+        if processed:
+            partition_manager.invalidate()
+            logger.info(f"Retention processed {len(processed)} partitions: {', '.join(processed)}")
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error(f"Retention job failed: {e}")
+    finally:
+        db_pool.putconn(conn)
 
 def maintenance_task():
-    conn = db_pool.getconn()
+    conn = get_db_pool().getconn()
     try:
-        cursor = conn.cursor()
-        cursor.execute("VACUUM ANALYZE posts")
-        cursor.execute("REINDEX TABLE posts CONCURRENTLY")
-        conn.commit()
+        run_maintenance(conn, MAINTENANCE_TIME_BUDGET)
         logger.info("Maintenance tasks completed")
     except Exception as e:
+        conn.rollback()
         logger.error(f"Maintenance failed: {e}")
     finally:
         db_pool.putconn(conn)
@@ -428,8 +947,10 @@ fastapi_app = FastAPI()
 
 @fastapi_app.get("/health")
 async def health_check():
-    status = "healthy" if last_job_success else "unhealthy"
-    last_run = last_job_time.isoformat() if last_job_time else "never"
+    writer_healthy = batch_writer.healthy() if batch_writer else True
+    status = "healthy" if accounts and writer_healthy and all(a.last_job_success for a in accounts.values()) else "unhealthy"
+    job_times = [a.last_job_time for a in accounts.values() if a.last_job_time]
+    last_run = max(job_times).isoformat() if job_times else "never"
     
     backup_status = "unhealthy"
     last_backup = "never"
@@ -450,34 +971,313 @@ async def health_check():
     return {
         "status": status,
         "last_job_time": last_run,
-        "rate_limit_wait": rate_limit_wait,
-        "requests_in_current_minute": request_count,
+        "accounts": {
+            tenant: {
+                "status": "healthy" if account.last_job_success else "unhealthy",
+                "last_job_time": account.last_job_time.isoformat() if account.last_job_time else "never",
+                "rate_limit_wait": round(account.rate_limiter.time_until_available(), 2),
+                "rate_limit_tokens_available": round(account.rate_limiter.available(), 2),
+                "token_expires_at": datetime.fromtimestamp(account.token_cache.expires_at).isoformat() if account.token_cache.expires_at else None,
+                "skipped_unchanged_last_run": account.skipped_unchanged_last,
+                "skipped_unchanged_total": account.skipped_unchanged_total
+            }
+            for tenant, account in accounts.items()
+        },
+        "write_queue": batch_writer.stats() if batch_writer else None,
+        "spool": spool.stats() if spool else None,
+        "trajectory_compression": trajectory_compressor.stats() if trajectory_compressor else None,
         "backup_status": backup_status,
         "last_backup_time": last_backup
     }
 
+@fastapi_app.get("/metrics")
+def prometheus_metrics():
+    """Per-stage latency, size and throughput metrics in the Prometheus text format."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@fastapi_app.get("/vehicles/latest")
+def vehicles_latest(tenant: str = None):
+    """Current position of every vehicle, read from vehicle_latest (one row per vehicle) joined with assets and status_codes."""
+    try:
+        conn = get_db_pool().getconn()
+    except (psycopg2.Error, RuntimeError) as e:
+        logger.error(f"Could not get a database connection: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    try:
+        with conn.cursor() as cursor:
+            vehicles = fetch_vehicle_latest(cursor, tenant)
+        conn.commit()
+        return {"count": len(vehicles), "vehicles": vehicles}
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error(f"Error reading latest vehicle positions: {e}")
+        raise HTTPException(status_code=500, detail="Could not read latest vehicle positions")
+    finally:
+        db_pool.putconn(conn)
+
+def stream_positions(tenant, start, end, asset_id, output_format, bbox=None):
+    """
+    StreamingResponse over iter_positions (or iter_bbox_positions when a
+    (min_lat, min_lon, max_lat, max_lon) bbox is given) holding one pooled connection until the stream ends.
+    """
+    if output_format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format {output_format}, use one of {', '.join(FORMATS)}")
+    # Naive timestamps are taken as local time, like the rest of the service
+    start, end = (ts if ts.tzinfo else ts.astimezone() for ts in (start, end))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    try:
+        conn = get_db_pool().getconn()
+    except (psycopg2.Error, RuntimeError) as e:
+        logger.error(f"Could not get a database connection: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    def rows():
+        try:
+            if bbox:
+                yield from iter_bbox_positions(conn, tenant, start, end, *bbox)
+            else:
+                yield from iter_positions(conn, tenant, start, end, asset_id, page_size=READ_API_PAGE_SIZE)
+        except psycopg2.Error as e:
+            logger.error(f"Error streaming positions: {e}")
+            raise
+        finally:
+            conn.rollback()
+            db_pool.putconn(conn)
+
+    encode, media_type = FORMATS[output_format]
+    return StreamingResponse(encode(rows()), media_type=media_type)
+
+@fastapi_app.get("/assets/{asset_id}/track")
+def asset_track(
+    asset_id: int,
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(None, alias="to"),
+    tenant: str = DEFAULT_TENANT,
+    format: str = "ndjson"
+):
+    """Positions of one asset in [from, to), streamed as NDJSON or CSV."""
+    return stream_positions(tenant, start, end or datetime.now(timezone.utc), asset_id, format)
+
+@fastapi_app.get("/positions")
+def positions(
+    since: datetime,
+    until: datetime = None,
+    tenant: str = DEFAULT_TENANT,
+    format: str = "ndjson"
+):
+    """All positions in [since, until) ordered by asset and time, streamed as NDJSON or CSV."""
+    return stream_positions(tenant, since, until or datetime.now(timezone.utc), None, format)
+
+@fastapi_app.get("/positions/bbox")
+def positions_bbox(
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+    since: datetime,
+    until: datetime = None,
+    tenant: str = DEFAULT_TENANT,
+    format: str = "ndjson"
+):
+    """Positions inside the bounding box during [since, until), streamed as NDJSON or CSV."""
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        raise HTTPException(status_code=400, detail="Invalid bounding box, boxes crossing the antimeridian must be split")
+    return stream_positions(
+        tenant, since, until or datetime.now(timezone.utc), None, format, (min_lat, min_lon, max_lat, max_lon)
+    )
+
+@fastapi_app.get("/analytics/assets")
+def analytics_assets(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(None, alias="to"),
+    tenant: str = DEFAULT_TENANT,
+    asset_id: list[int] = Query(None),
+    stop_speed_kmh: float = 2.0,
+    min_stop_minutes: float = 5.0
+):
+    """Per-asset distance, speeds, idle time and stops in [from, to)."""
+    start, end = (ts if ts.tzinfo else ts.astimezone() for ts in (start, end or datetime.now(timezone.utc)))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    try:
+        conn = get_db_pool().getconn()
+    except (psycopg2.Error, RuntimeError) as e:
+        logger.error(f"Could not get a database connection: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    try:
+        asset_results = asset_metrics(
+            conn, analytics_cache, tenant, start, end, asset_id,
+            stop_speed_mps=stop_speed_kmh / 3.6, min_stop_seconds=min_stop_minutes * 60
+        )
+        return {"from": start.isoformat(), "to": end.isoformat(), "assets": asset_results}
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error(f"Error computing asset analytics: {e}")
+        raise HTTPException(status_code=500, detail="Could not compute asset analytics")
+    finally:
+        db_pool.putconn(conn)
+
+def record_async_cycle(account):
+    def record(success, skipped):
+        account.record_result(success, datetime.now())
+        account.record_skipped(skipped)
+    return record
+
+async def run_async_pipeline():
+    """Poll all accounts concurrently on the running event loop with httpx and asyncpg."""
+    writer = AsyncWriter(
+        {'host': POSTGRES_HOST, 'user': POSTGRES_USER, 'password': POSTGRES_PASSWORD, 'database': POSTGRES_DB,
+         'timeout': DB_CONNECT_TIMEOUT},
+        POSTS_COLUMNS,
+        UPSERT_CONFLICT_CLAUSE,
+        dimensions,
+        max_size=min(POLL_WORKERS, 10),
+        before_store=ensure_partitions_async,
+        after_insert=update_vehicle_latest_async,
+        reject=split_by_event_window
+    )
+    try:
+        await asyncio.gather(*(
+            run_polling(
+                AsyncFetcher(account),
+                writer,
+                lambda assets_data, tenant=account.tenant: compress_rows(prepare_vehicle_status_data(assets_data, tenant)),
+                last_seen_cache,
+                max(FETCH_INTERVAL, MIN_INTERVAL_SECONDS),
+                record_async_cycle(account),
+                on_failed=spool_rows
+            )
+            for account in accounts.values()
+        ))
+    finally:
+        await writer.close()
+
+# Running async pipeline task and the pending restart after it died, when ASYNC_PIPELINE is enabled
+polling_task = None
+polling_restart = None
+
+def start_async_pipeline():
+    global polling_task, polling_restart
+    polling_restart = None
+    polling_task = asyncio.create_task(run_async_pipeline())
+    polling_task.add_done_callback(restart_async_pipeline)
+
+def restart_async_pipeline(task):
+    """Done-callback of the polling task: log why it stopped and start it again unless it was cancelled."""
+    global polling_restart
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error:
+        logger.error(f"Async pipeline stopped: {error!r}", exc_info=error)
+    else:
+        logger.error("Async pipeline stopped unexpectedly")
+    logger.info(f"Restarting async pipeline in {ASYNC_PIPELINE_RESTART_SECONDS}s")
+    polling_restart = asyncio.get_running_loop().call_later(ASYNC_PIPELINE_RESTART_SECONDS, start_async_pipeline)
+
 async def run_fastapi():
     config = uvicorn.Config(fastapi_app, host="0.0.0.0", port=API_PORT, log_level="info")
     server = uvicorn.Server(config)
-    await server.serve()
+    if ASYNC_PIPELINE:
+        start_async_pipeline()
+    try:
+        await server.serve()
+    finally:
+        if polling_restart:
+            polling_restart.cancel()
+        if polling_task:
+            polling_task.cancel()
 
 def main():
-    init_db()
-    session = create_session()
-    
-    db_url = f'postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}/{POSTGRES_DB}'
+    global scheduler, batch_writer, spool, trajectory_compressor, raw_archive
+    for config in load_account_configs(API_ACCOUNTS_FILE, API_BASE_URL, API_USERNAME, API_PASSWORD):
+        accounts[config['tenant']] = create_account(config)
+
+    if SPOOL_ENABLED:
+        spool = Spool(SPOOL_DIR, SPOOL_SEGMENT_BYTES, SPOOL_MAX_BYTES, SPOOL_EVICTION)
+
+    if TRAJECTORY_COMPRESSION:
+        trajectory_compressor = DeadBandCompressor(
+            TRAJECTORY_MIN_DISTANCE_M, TRAJECTORY_MIN_HEADING_DEG, TRAJECTORY_MAX_GAP_SECONDS
+        )
+        if TRAJECTORY_RAW_ARCHIVE_DIR:
+            raw_archive = RawArchive(TRAJECTORY_RAW_ARCHIVE_DIR, POSTS_COLUMNS)
+
+    if WRITER_THREAD and not ASYNC_PIPELINE:
+        batch_writer = BatchWriter(
+            store=store_vehicle_status_data,
+            on_stored=last_seen_cache.mark_stored,
+            on_failed=spool_rows,
+            key=posts_row_key,
+            max_batches=WRITE_QUEUE_MAX_BATCHES,
+            flush_rows=WRITER_FLUSH_ROWS,
+            flush_interval=WRITER_FLUSH_INTERVAL,
+            put_timeout=WRITE_QUEUE_PUT_TIMEOUT
+        )
+        batch_writer.start()
+
+    # A single attempt: while the database is down, batches go to the spool and the
+    # pool is created by the first write or replay that finds it reachable.
+    # An unmigrated schema (RuntimeError) still stops the app here.
+    try:
+        get_db_pool()
+    except psycopg2.OperationalError as e:
+        logger.warning(f"Database unavailable at startup, starting without it: {e}")
+
+    if db_pool:
+        db_url = f'postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}/{POSTGRES_DB}'
+        jobstore = SQLAlchemyJobStore(url=db_url)
+    else:
+        # Every job is re-added with replace_existing below, so nothing is lost without persistence
+        logger.warning("Using an in-memory job store until the next restart")
+        jobstore = MemoryJobStore()
     jobstores = {
-        'default': SQLAlchemyJobStore(url=db_url)
+        'default': jobstore
     }
-    scheduler = BackgroundScheduler(jobstores=jobstores)
-    scheduler.add_job(
-        fetch_and_store,
-        trigger=IntervalTrigger(seconds=max(FETCH_INTERVAL, MIN_INTERVAL_SECONDS)),
-        args=[session],
-        id='fetch_job',
-        name='Fetch and store API data',
-        replace_existing=True
-    )
+    executors = {
+        'default': ThreadPoolExecutor(POLL_WORKERS)
+    }
+    scheduler = BackgroundScheduler(jobstores=jobstores, executors=executors)
+    if not ASYNC_PIPELINE:
+        for tenant in accounts:
+            scheduler.add_job(
+                fetch_and_store,
+                trigger=IntervalTrigger(seconds=max(FETCH_INTERVAL, MIN_INTERVAL_SECONDS)),
+                args=[tenant],
+                id=f'fetch_job_{tenant}',
+                name=f'Fetch and store API data for {tenant}',
+                replace_existing=True
+            )
+    if spool:
+        scheduler.add_job(
+            replay_spool,
+            trigger=IntervalTrigger(seconds=SPOOL_REPLAY_INTERVAL),
+            id='spool_replay_job',
+            name='Replay spooled batches',
+            replace_existing=True,
+            max_instances=1
+        )
+    if EXPORT_ENABLED:
+        scheduler.add_job(
+            export_job,
+            trigger=IntervalTrigger(days=1),
+            id='export_job',
+            name='Daily columnar export of closed partitions',
+            replace_existing=True,
+            max_instances=1,
+            misfire_grace_time=3600
+        )
+    if RETENTION_MONTHS > 0:
+        scheduler.add_job(
+            retention_job,
+            trigger=IntervalTrigger(days=1),
+            id='retention_job',
+            name='Daily partition retention',
+            replace_existing=True,
+            misfire_grace_time=3600
+        )
     scheduler.add_job(
         maintenance_task,
         trigger=IntervalTrigger(days=7),
@@ -493,7 +1293,7 @@ def main():
         replace_existing=True
     )
     scheduler.add_job(
-        create_future_partitions,
+        create_future_partitions_job,
         trigger=IntervalTrigger(days=7),
         id='partition_creation_job',
         name='Create future partitions',
@@ -504,12 +1304,22 @@ def main():
     
     try:
         scheduler.start()
+        if scheduler.get_job('fetch_job'):
+            scheduler.remove_job('fetch_job')
+            logger.info("Removed persisted single-account fetch job")
+        if ASYNC_PIPELINE:
+            for tenant in accounts:
+                if scheduler.get_job(f'fetch_job_{tenant}'):
+                    scheduler.remove_job(f'fetch_job_{tenant}')
+            logger.info("Async pipeline enabled, fetch jobs run on the event loop")
         logger.info(f"Scheduler started. Fetching every {max(FETCH_INTERVAL, MIN_INTERVAL_SECONDS)} seconds")
         asyncio.run(run_fastapi())
     except (KeyboardInterrupt, SystemExit):
         scheduler.shutdown()
         logger.info("Scheduler shut down gracefully")
     finally:
+        if batch_writer:
+            batch_writer.stop()
         if db_pool:
             db_pool.closeall()
 
@@ -0,0 +1,123 @@
+import logging
+import time
+from psycopg2 import sql
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PARTITION_STATS_SQL = """
+    SELECT r.partition_name,
+           s.n_live_tup,
+           s.n_dead_tup,
+           s.n_mod_since_analyze,
+           s.n_ins_since_vacuum,
+           s.last_autovacuum,
+           s.last_vacuum,
+           pg_table_size(s.relid) AS table_bytes
+    FROM posts_partition_ranges r
+    JOIN pg_stat_user_tables s ON s.relname = r.partition_name
+    WHERE s.n_dead_tup > 0 OR s.n_mod_since_analyze > 0 OR s.n_ins_since_vacuum > 0
+"""
+
+# Estimated size of each index against the size a freshly built b-tree would have:
+# per entry an 8 byte tuple header, a 4 byte line pointer and the aligned key width, at 90% fill.
+INDEX_BLOAT_SQL = """
+    SELECT ic.relname AS index_name,
+           t.relname AS partition_name,
+           pg_relation_size(i.indexrelid) AS index_bytes,
+           greatest(t.reltuples, 0) * (12 + ceil(coalesce(w.key_width, 8) / 8.0) * 8) / 0.9 + 8192 AS expected_bytes
+    FROM pg_index i
+    JOIN pg_class ic ON ic.oid = i.indexrelid
+    JOIN pg_class t ON t.oid = i.indrelid
+    JOIN pg_am am ON am.oid = ic.relam AND am.amname = 'btree'
+    LEFT JOIN LATERAL (
+        SELECT sum(st.avg_width) AS key_width
+        FROM pg_attribute a
+        JOIN pg_stats st ON st.tablename = t.relname AND st.attname = a.attname
+        WHERE a.attrelid = t.oid AND a.attnum = ANY(i.indkey)
+    ) w ON true
+    WHERE t.relname = ANY(%s)
+"""
+
+def plan_maintenance(conn, min_dead_tuples=1000, min_dead_ratio=0.05, min_bloat_ratio=1.5,
+                     min_index_bytes=8 * 1024 * 1024):
+    """
+    Read per-partition statistics for recently written posts partitions and return the
+    VACUUM / REINDEX actions worth running, ordered by estimated reclaimable bytes.
+    Each action is (benefit_bytes, kind, object_name, detail).
+    """
+    actions = []
+    with conn.cursor() as cur:
+        cur.execute(PARTITION_STATS_SQL)
+        partitions = cur.fetchall()
+
+        for name, live, dead, mod_since_analyze, ins_since_vacuum, last_autovacuum, last_vacuum, table_bytes in partitions:
+            total = live + dead
+            if dead >= min_dead_tuples and total and dead / total >= min_dead_ratio:
+                benefit = table_bytes * dead / total
+                actions.append((benefit, 'vacuum', name,
+                                f"dead={dead} live={live} last_autovacuum={last_autovacuum} last_vacuum={last_vacuum}"))
+            elif live and mod_since_analyze / live >= min_dead_ratio:
+                actions.append((0, 'analyze', name, f"modified_since_analyze={mod_since_analyze}"))
+
+        if partitions:
+            cur.execute(INDEX_BLOAT_SQL, ([p[0] for p in partitions],))
+            for index_name, partition_name, index_bytes, expected_bytes in cur.fetchall():
+                expected_bytes = float(expected_bytes)
+                if index_bytes >= min_index_bytes and index_bytes / expected_bytes >= min_bloat_ratio:
+                    actions.append((index_bytes - expected_bytes, 'reindex', index_name,
+                                    f"partition={partition_name} size={index_bytes} estimated={expected_bytes:.0f}"))
+    conn.commit()
+
+    actions.sort(key=lambda action: action[0], reverse=True)
+    return actions
+
+def _statement(kind, object_name):
+    if kind == 'vacuum':
+        return sql.SQL("VACUUM (ANALYZE) {}").format(sql.Identifier(object_name))
+    if kind == 'analyze':
+        return sql.SQL("ANALYZE {}").format(sql.Identifier(object_name))
+    return sql.SQL("REINDEX INDEX CONCURRENTLY {}").format(sql.Identifier(object_name))
+
+def run_maintenance(conn, time_budget_seconds=600, **thresholds):
+    """
+    Run the planned actions in autocommit mode (VACUUM and REINDEX CONCURRENTLY cannot run
+    inside a transaction) until the time budget is used up, recording each one in
+    maintenance_log. Returns the list of (kind, object_name, seconds) that ran.
+    """
+    actions = plan_maintenance(conn, **thresholds)
+    if not actions:
+        logger.info("Maintenance: no partition needs VACUUM or REINDEX")
+        return []
+
+    started = time.monotonic()
+    done = []
+    previous_autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for benefit, kind, object_name, detail in actions:
+                if time.monotonic() - started >= time_budget_seconds:
+                    logger.info(f"Maintenance time budget of {time_budget_seconds}s used, "
+                                f"{len(actions) - len(done)} actions deferred to next run")
+                    break
+                action_started = time.monotonic()
+                try:
+                    cur.execute(_statement(kind, object_name))
+                    status = 'ok'
+                except Exception as e:
+                    status = f"failed: {e}"
+                    logger.error(f"Maintenance {kind} on {object_name} failed: {e}")
+                duration = time.monotonic() - action_started
+                metrics.MAINTENANCE_SECONDS.labels(kind, 'ok' if status == 'ok' else 'failed').observe(duration)
+                cur.execute("""
+                    INSERT INTO maintenance_log (action, object_name, duration_ms, estimated_benefit_bytes, detail, status)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (kind, object_name, int(duration * 1000), int(benefit), detail, status))
+                done.append((kind, object_name, duration))
+                logger.info(f"Maintenance {kind} on {object_name} took {duration:.2f}s ({status})")
+    finally:
+        conn.autocommit = previous_autocommit
+
+    logger.info(f"Maintenance ran {len(done)} of {len(actions)} actions in {time.monotonic() - started:.2f}s")
+    return done
@@ -0,0 +1,62 @@
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Latency buckets from a few ms (cached partitions, small batches) up to slow API responses
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 1 KiB .. 64 MiB in powers of four
+PAYLOAD_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+ROW_BUCKETS = (10, 100, 500, 1000, 5000, 10000, 50000, 100000)
+# Rate limiter delays are whole refill intervals (15s at 4 requests/minute)
+WAIT_BUCKETS = (0.1, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0)
+MAINTENANCE_BUCKETS = (0.1, 1.0, 10.0, 30.0, 60.0, 300.0, 600.0, 1800.0)
+
+LOGIN_SECONDS = Histogram(
+    'collector_login_seconds', 'Latency of /login requests', ['tenant', 'outcome'], buckets=LATENCY_BUCKETS
+)
+GET_ASSETS_SECONDS = Histogram(
+    'collector_get_assets_seconds', 'Latency of /v1/assets/ requests (until the headers arrive when streaming)',
+    ['tenant', 'outcome'], buckets=LATENCY_BUCKETS
+)
+GET_ASSETS_BYTES = Histogram(
+    'collector_get_assets_payload_bytes', 'Size of /v1/assets/ response bodies as received',
+    ['tenant'], buckets=PAYLOAD_BUCKETS
+)
+PREPARE_SECONDS = Histogram(
+    'collector_prepare_seconds', 'Time spent turning an assets response into row tuples',
+    ['tenant'], buckets=LATENCY_BUCKETS
+)
+PREPARED_ROWS = Histogram(
+    'collector_prepared_rows', 'Rows produced per prepared assets response', ['tenant'], buckets=ROW_BUCKETS
+)
+DB_WRITE_SECONDS = Histogram(
+    'collector_db_write_seconds', 'Time to store one batch, commit included', ['mode'], buckets=LATENCY_BUCKETS
+)
+DB_WRITE_ROWS = Counter('collector_db_write_rows', 'Rows stored in posts', ['mode'])
+DB_WRITE_ROWS_PER_SECOND = Gauge(
+    'collector_db_write_rows_per_second', 'Throughput of the most recent stored batch', ['mode']
+)
+WRITE_FALLBACKS = Counter(
+    'collector_write_fallbacks', 'Activations of the write fallback paths', ['path']
+)
+DEAD_LETTER_ROWS = Counter('collector_dead_letter_rows', 'Rows moved to posts_dead_letter')
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    'collector_rate_limit_wait_seconds', 'Delay imposed by the per-account rate limiter before a request',
+    ['tenant'], buckets=WAIT_BUCKETS
+)
+PARTITIONS_CREATED = Counter(
+    'collector_partitions_created', 'Partitions created on demand (create_posts_partition() reported created)'
+)
+MAINTENANCE_SECONDS = Histogram(
+    'collector_maintenance_seconds', 'Duration of VACUUM / ANALYZE / REINDEX maintenance actions',
+    ['action', 'status'], buckets=MAINTENANCE_BUCKETS
+)
+
+def observe_write(mode, rows, seconds):
+    """Record one stored batch: latency, row count and rows per second."""
+    DB_WRITE_SECONDS.labels(mode).observe(seconds)
+    DB_WRITE_ROWS.labels(mode).inc(rows)
+    if seconds > 0:
+        DB_WRITE_ROWS_PER_SECOND.labels(mode).set(rows / seconds)
+
+def render():
+    """Current values of all metrics as (body, content type) in the Prometheus text format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
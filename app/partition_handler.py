@@ -1,32 +1,36 @@
 import re
+import threading
+from bisect import bisect_right
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import psycopg2
-from psycopg2.extensions import AsIs
 import logging
+import metrics
 
 def create_partition_for_date(conn, date):
-    """Create a monthly partition for the given date"""
+    """
+    Create the partition containing the given date via create_posts_partition(), which applies
+    the configured granularity (daily/weekly/monthly) and naming in the database timezone,
+    the same way manage_partitions() does. Returns the (start, end) range, or None.
+    """
     cur = conn.cursor()
     try:
-        # Calculate partition start (1st of the month) and end (1st of next month)
-        partition_start = date.replace(day=1)
-        partition_end = partition_start + relativedelta(months=1)
-        
-        partition_name = f"posts_{partition_start.strftime('%Y_%m')}"
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS %s PARTITION OF posts
-            FOR VALUES FROM (%s) TO (%s)
-        """, (AsIs(partition_name), partition_start, partition_end))
-        
+        cur.execute(
+            "SELECT partition_name, range_start, range_end, created FROM create_posts_partition(%s::timestamptz)",
+            (date,)
+        )
+        partition_name, partition_start, partition_end, created = cur.fetchone()
+
         conn.commit()
-        logging.info(f"Created new partition {partition_name}")
-        return True
-        
+        if created:
+            metrics.PARTITIONS_CREATED.inc()
+        logging.info(f"{'Created' if created else 'Found existing'} partition {partition_name} for {partition_start} - {partition_end}")
+        return partition_start, partition_end
+
     except Exception as e:
+        conn.rollback()
         logging.error(f"Error creating partition: {str(e)}")
-        return False
+        return None
     finally:
         cur.close()
 
@@ -38,23 +42,172 @@ def handle_missing_partition_error(conn, error_message):
         date_str = match.group(1)
         try:
             date = datetime.strptime(date_str, '%Y-%m-%d')
-            return create_partition_for_date(conn, date)
+            return create_partition_for_date(conn, date) is not None
         except ValueError:
             logging.error(f"Could not parse date from error message: {date_str}")
             return False
     return False
 
-def create_future_partitions():
-    """Create partitions for the current and next two months to prevent missing partition errors."""
-    conn = conn.cursor()
+class PartitionManager:
+    """
+    Keeps the set of existing posts partition ranges in memory, loaded once from pg_inherits,
+    so each batch can be checked against it and missing partitions created before the insert
+    instead of after a failed round trip.
+    The (starts, ends) lists are replaced, never modified in place, so covers() can read a
+    consistent snapshot without taking the lock that ensure_partitions() holds across queries.
+    """
+
+    def __init__(self):
+        self.granularity = None
+        self.retired_before = None
+        self._ranges = ([], [])
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def load(self, conn):
+        """
+        (Re)load posts partition ranges (from pg_inherits via posts_partition_ranges), the granularity
+        and the end of the ranges retired by retention
+        """
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT range_start, range_end FROM posts_partition_ranges
+                WHERE range_start IS NOT NULL
+                ORDER BY range_start
+            """)
+            ranges = cur.fetchall()
+            cur.execute("SELECT posts_partition_granularity(), posts_retired_before()")
+            granularity, retired_before = cur.fetchone()
+        conn.commit()
+
+        with self._lock:
+            self.granularity = granularity
+            self.retired_before = retired_before
+            self._ranges = ([start for start, _ in ranges], [end for _, end in ranges])
+            self._loaded = True
+        logging.info(f"Loaded {len(ranges)} posts partition ranges ({granularity})")
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    @staticmethod
+    def _covering_end(ranges, ts):
+        """End of the cached partition containing ts, or None if no partition covers it"""
+        starts, ends = ranges
+        index = bisect_right(starts, ts) - 1
+        if index >= 0 and ts < ends[index]:
+            return ends[index]
+        return None
+
+    def _add_range(self, start, end):
+        starts, ends = self._ranges
+        index = bisect_right(starts, start)
+        self._ranges = (starts[:index] + [start] + starts[index:], ends[:index] + [end] + ends[index:])
+
+    def covers(self, timestamps):
+        """
+        True if the cached ranges cover every timestamp given. Never blocks and never
+        touches the database; False when the cache is not loaded.
+        """
+        if not self._loaded:
+            return False
+        ranges = self._ranges
+        return all(self._covering_end(ranges, ts) is not None for ts in timestamps)
+
+    def ensure_timestamps(self, conn, timestamps):
+        """
+        Make sure a partition exists for each of the given timestamps, creating only the
+        partitions those timestamps fall into (never the empty periods between them).
+        Only touches the database when the cache shows a gap. Returns True if all are covered.
+        """
+        with self._lock:
+            if not self._loaded:
+                self.load(conn)
+
+            covered_until = None
+            for ts in sorted(set(timestamps)):
+                if covered_until is not None and ts < covered_until:
+                    continue
+                covered_until = self._covering_end(self._ranges, ts)
+                if covered_until is None:
+                    created = create_partition_for_date(conn, ts)
+                    if created is None:
+                        return False
+                    self._add_range(*created)
+                    covered_until = created[1]
+            return True
+
+    def ensure_partitions(self, conn, start, end):
+        """
+        Make sure every instant in [start, end] is covered by a partition, creating the
+        missing ones. Meant for pre-creating the upcoming periods; batches use ensure_timestamps().
+        Returns True if the whole range is covered.
+        """
+        with self._lock:
+            if not self._loaded:
+                self.load(conn)
+
+            ts = start
+            while ts <= end:
+                covering_end = self._covering_end(self._ranges, ts)
+                if covering_end is None:
+                    created = create_partition_for_date(conn, ts)
+                    if created is None:
+                        return False
+                    self._add_range(*created)
+                    covering_end = created[1]
+                ts = covering_end
+            return True
+
+def create_future_partitions(conn, manager, months_ahead=2):
+    """Create partitions for the current and next months to prevent missing partition errors."""
     try:
-        current_date = datetime.now()
-        for i in range(3):  # Current month + next 2 months
-            create_partition(conn, current_date + relativedelta(months=i))
-        logging.info("Future partitions created successfully")
-        return True
-    except Exception as e:
+        current_date = datetime.now().astimezone()
+        if manager.ensure_partitions(conn, current_date, current_date + relativedelta(months=months_ahead)):
+            logging.info("Future partitions created successfully")
+            return True
+        logging.error("Could not create all future partitions")
+        return False
+    except psycopg2.Error as e:
+        conn.rollback()
         logging.error(f"Error creating future partitions: {str(e)}")
         return False
-    finally:
-        cur.close()
+
+# Days covered by one partition of each granularity, largest first
+GRANULARITY_DAYS = (('monthly', 31), ('weekly', 7), ('daily', 1))
+
+def recommend_granularity(rows_per_day, index_bytes_per_row, shared_buffers_bytes, buffer_fraction=0.25):
+    """
+    Recommend the coarsest granularity whose per-partition indexes still fit in the given
+    fraction of shared_buffers, so the hot partition's indexes stay cached while ingesting.
+    """
+    budget = shared_buffers_bytes * buffer_fraction
+    for granularity, days in GRANULARITY_DAYS:
+        if rows_per_day * days * index_bytes_per_row <= budget:
+            return granularity
+    return 'daily'
+
+def recommend_partition_granularity(conn, sample_days=7, default_index_bytes_per_row=100):
+    """
+    Measure rows per day over the last sample_days and the index footprint per row of the
+    existing partitions, and return (recommendation, rows_per_day).
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT count(*) FROM posts WHERE event_time >= now() - make_interval(days => %s)",
+            (sample_days,)
+        )
+        rows_per_day = cur.fetchone()[0] / sample_days
+        cur.execute("""
+            SELECT coalesce(sum(pg_indexes_size(c.oid)), 0), coalesce(sum(c.reltuples), 0)
+            FROM posts_partition_ranges r
+            JOIN pg_class c ON c.relname = r.partition_name
+        """)
+        index_bytes, tuples = cur.fetchone()
+        cur.execute("SELECT setting::bigint * pg_size_bytes(unit) FROM pg_settings WHERE name = 'shared_buffers'")
+        shared_buffers_bytes = cur.fetchone()[0]
+    conn.commit()
+
+    index_bytes_per_row = index_bytes / tuples if tuples and tuples > 0 else default_index_bytes_per_row
+    return recommend_granularity(rows_per_day, index_bytes_per_row, shared_buffers_bytes), rows_per_day
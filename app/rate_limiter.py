@@ -0,0 +1,48 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+    Holds up to `capacity` tokens and refills `refill_per_second` tokens per second.
+    Callers take a token before sending a request; when none is available they get
+    the delay until the next one instead of being blocked.
+    """
+
+    def __init__(self, capacity, refill_per_second, clock=time.monotonic):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.refill_per_second)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available. Returns True on success, never sleeps."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def time_until_available(self, tokens=1):
+        """Seconds until `tokens` can be acquired, 0 if they are available now"""
+        with self._lock:
+            self._refill()
+            missing = tokens - self._tokens
+            if missing <= 0:
+                return 0.0
+            return missing / self.refill_per_second
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import logging
+from decimal import Decimal
+from datetime import datetime
+from zorder import bbox_ranges
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = (
+    'tenant', 'asset_id', 'event_time', 'latitude', 'longitude',
+    'status_text', 'position_description', 'name', 'plate_number', 'vin'
+)
+
+# event_time bounds are always literal parameters so the planner prunes partitions
+# outside [start, end); (asset_id, event_time) keyset pages walk the per-partition primary key,
+# which is why the row comparison includes the leading tenant column.
+KEYSET_PAGE_SQL = f"""
+    SELECT {', '.join(EXPORT_COLUMNS)}
+    FROM posts_wide
+    WHERE tenant = %(tenant)s
+      AND event_time >= %(start)s AND event_time < %(end)s
+      {{asset_filter}}
+      AND (tenant, asset_id, event_time) > (%(tenant)s, %(after_asset_id)s, %(after_event_time)s)
+    ORDER BY asset_id, event_time
+    LIMIT %(page_size)s
+"""
+
+def iter_positions(conn, tenant, start, end, asset_id=None, page_size=5000, fetch_size=1000):
+    """
+    Yield posts rows for [start, end) ordered by (asset_id, event_time), one keyset page at a time.
+    Each page is read through a server-side cursor in fetch_size chunks and its transaction is
+    closed before the next page, so memory and snapshot age stay constant however long the range is.
+    """
+    query = KEYSET_PAGE_SQL.format(asset_filter="AND asset_id = %(asset_id)s" if asset_id is not None else "")
+    params = {
+        'tenant': tenant,
+        'start': start,
+        'end': end,
+        'asset_id': asset_id,
+        'after_asset_id': asset_id if asset_id is not None else -2147483648,
+        'after_event_time': '-infinity',
+        'page_size': page_size,
+    }
+    page = 0
+    while True:
+        page += 1
+        with conn.cursor(name=f"positions_page_{page}") as cursor:
+            cursor.itersize = fetch_size
+            cursor.execute(query, params)
+            count = 0
+            last = None
+            for row in cursor:
+                count += 1
+                last = row
+                yield row
+        conn.commit()
+        if count < page_size:
+            return
+        params['after_asset_id'] = last[1]
+        params['after_event_time'] = last[2]
+
+BBOX_SQL = f"""
+    SELECT {', '.join('p.' + column for column in EXPORT_COLUMNS)}
+    FROM posts_wide p
+    JOIN unnest(%(low)s::bigint[], %(high)s::bigint[]) AS r(low, high)
+      ON p.zorder BETWEEN r.low AND r.high
+    WHERE p.tenant = %(tenant)s
+      AND p.event_time >= %(start)s AND p.event_time < %(end)s
+      AND p.latitude BETWEEN %(min_lat)s AND %(max_lat)s
+      AND p.longitude BETWEEN %(min_lon)s AND %(max_lon)s
+"""
+
+def iter_bbox_positions(conn, tenant, start, end, min_lat, min_lon, max_lat, max_lon, fetch_size=1000):
+    """
+    Yield posts rows inside the bounding box during [start, end). The box is covered by Z-order
+    ranges probed through the (tenant, zorder, event_time) index of each partition left after
+    time pruning; the exact latitude/longitude filter removes the overscan at the edges.
+    """
+    ranges = bbox_ranges(min_lat, min_lon, max_lat, max_lon)
+    params = {
+        'tenant': tenant,
+        'start': start,
+        'end': end,
+        'low': [low for low, _ in ranges],
+        'high': [high for _, high in ranges],
+        'min_lat': min_lat,
+        'max_lat': max_lat,
+        'min_lon': min_lon,
+        'max_lon': max_lon,
+    }
+    with conn.cursor(name="bbox_positions") as cursor:
+        cursor.itersize = fetch_size
+        cursor.execute(BBOX_SQL, params)
+        yield from cursor
+    conn.commit()
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps({column: _json_value(value) for column, value in zip(EXPORT_COLUMNS, row)}) + '\n'
+
+def csv_lines(rows, chunk_rows=1000):
+    """CSV with a header row, emitted in chunks of chunk_rows rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow([_json_value(value) for value in row])
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
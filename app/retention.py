@@ -0,0 +1,166 @@
+import gzip
+import logging
+import os
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+import psycopg2
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SQL = """
+    INSERT INTO posts_summary (
+        tenant, asset_id, bucket_start, first_time, last_time,
+        first_latitude, first_longitude, last_latitude, last_longitude,
+        distance_m, point_count
+    )
+    SELECT
+        tenant,
+        asset_id,
+        bucket_start,
+        min(event_time),
+        max(event_time),
+        (array_agg(latitude ORDER BY event_time))[1],
+        (array_agg(longitude ORDER BY event_time))[1],
+        (array_agg(latitude ORDER BY event_time DESC))[1],
+        (array_agg(longitude ORDER BY event_time DESC))[1],
+        sum(step_m),
+        count(*)
+    FROM (
+        SELECT
+            tenant, asset_id, event_time, latitude, longitude, bucket_start,
+            coalesce(2 * 6371000 * asin(sqrt(
+                power(sin(radians(latitude - lag(latitude) OVER w) / 2), 2)
+                + cos(radians(lag(latitude) OVER w)) * cos(radians(latitude))
+                * power(sin(radians(longitude - lag(longitude) OVER w) / 2), 2)
+            )), 0) AS step_m
+        FROM (
+            SELECT tenant, asset_id, event_time, latitude::double precision AS latitude,
+                   longitude::double precision AS longitude,
+                   to_timestamp(floor(extract(epoch FROM event_time) / %(bucket)s) * %(bucket)s) AS bucket_start
+            FROM {partition}
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        ) points
+        WINDOW w AS (PARTITION BY tenant, asset_id, bucket_start ORDER BY event_time)
+    ) steps
+    GROUP BY tenant, asset_id, bucket_start
+    ON CONFLICT (tenant, asset_id, bucket_start) DO UPDATE SET
+        first_time = EXCLUDED.first_time,
+        last_time = EXCLUDED.last_time,
+        first_latitude = EXCLUDED.first_latitude,
+        first_longitude = EXCLUDED.first_longitude,
+        last_latitude = EXCLUDED.last_latitude,
+        last_longitude = EXCLUDED.last_longitude,
+        distance_m = EXCLUDED.distance_m,
+        point_count = EXCLUDED.point_count
+"""
+
+def expired_partitions(conn, retention_months):
+    """Partitions whose whole range is older than the hot window, oldest first"""
+    cutoff = datetime.now().astimezone() - relativedelta(months=retention_months)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT partition_name, range_start, range_end
+            FROM posts_partition_ranges
+            WHERE range_end <= %s
+            ORDER BY range_start
+        """, (cutoff,))
+        partitions = cur.fetchall()
+    conn.commit()
+    return partitions
+
+def summarize_partition(conn, partition_name, bucket_seconds):
+    """Aggregate a raw partition into per-asset, per-bucket rows in posts_summary"""
+    with conn.cursor() as cur:
+        cur.execute(
+            sql.SQL(SUMMARY_SQL).format(partition=sql.Identifier(partition_name)),
+            {'bucket': bucket_seconds}
+        )
+        summarized = cur.rowcount
+    conn.commit()
+    return summarized
+
+def archive_partition(conn, partition_name, archive_dir):
+    """
+    Write the raw partition to a gzip-compressed CSV, sorted by (tenant, asset_id, event_time).
+    An existing archive of the same name is never overwritten; the new one gets a timestamp suffix.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{partition_name}.csv.gz")
+    if os.path.exists(path):
+        path = os.path.join(archive_dir, f"{partition_name}_{datetime.now():%Y%m%d%H%M%S}.csv.gz")
+    tmp_path = f"{path}.tmp"
+    # Archives stay self-contained: asset attributes and status text are joined back in
+    query = sql.SQL("""
+        COPY (
+            SELECT p.*, a.name, a.plate_number, a.vin, s.status_text
+            FROM {} p
+            LEFT JOIN assets a USING (tenant, asset_id)
+            LEFT JOIN status_codes s ON s.id = p.status_id
+            ORDER BY p.tenant, p.asset_id, p.event_time
+        ) TO STDOUT WITH CSV HEADER
+    """).format(sql.Identifier(partition_name))
+
+    with gzip.open(tmp_path, 'wb') as f, conn.cursor() as cur:
+        cur.copy_expert(query.as_string(conn), f)
+    conn.commit()
+
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+def detach_partition(conn, partition_name, range_end, drop=True):
+    """
+    Detach the raw partition from posts and drop it once it is summarized and archived.
+    The range is recorded as retired (partition_config.retired_before), so
+    create_posts_partition() refuses to recreate it for late or replayed rows, which end up
+    in posts_dead_letter instead of a partition that would be summarized a second time.
+    A kept table is renamed to <partition>_archived (with a timestamp suffix if taken).
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("ALTER TABLE posts DETACH PARTITION {}").format(sql.Identifier(partition_name)))
+        if drop:
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition_name)))
+            action = 'Detached and dropped partition'
+        else:
+            kept_name = f"{partition_name}_archived"
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (kept_name,))
+            if cur.fetchone()[0]:
+                kept_name = f"{kept_name}_{datetime.now():%Y%m%d%H%M%S}"
+            cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                sql.Identifier(partition_name), sql.Identifier(kept_name)
+            ))
+            action = f"Detached partition, kept as {kept_name}"
+        cur.execute("""
+            INSERT INTO partition_config (key, value) VALUES ('retired_before', %s)
+            ON CONFLICT (key) DO UPDATE
+            SET value = greatest(partition_config.value::timestamptz, EXCLUDED.value::timestamptz)::text
+        """, (range_end.isoformat(),))
+        cur.execute(
+            "INSERT INTO partition_management_log (action, partition_name) VALUES (%s, %s)",
+            (action, partition_name)
+        )
+    conn.commit()
+
+def apply_retention(conn, retention_months, bucket_seconds, archive_dir, drop_detached=True):
+    """
+    Roll every partition older than retention_months into posts_summary, archive its raw rows
+    and detach it, so posts only holds the hot window. Returns the processed partition names.
+    """
+    processed = []
+    for partition_name, range_start, range_end in expired_partitions(conn, retention_months):
+        try:
+            summarized = summarize_partition(conn, partition_name, bucket_seconds)
+            path = archive_partition(conn, partition_name, archive_dir)
+            detach_partition(conn, partition_name, range_end, drop_detached)
+            processed.append(partition_name)
+            logger.info(
+                f"Retention: {partition_name} ({range_start} - {range_end}) rolled into "
+                f"{summarized} summary rows, archived to {path}"
+            )
+        except (psycopg2.Error, OSError) as e:
+            conn.rollback()
+            logger.error(f"Retention failed for {partition_name}, leaving it attached: {e}")
+            break
+    return processed
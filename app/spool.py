@@ -0,0 +1,187 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+# Record layout: uint32 payload length, uint32 crc32 of the payload, zlib-compressed payload
+RECORD_HEADER = struct.Struct('>II')
+SEGMENT_PREFIX = 'spool-'
+SEGMENT_SUFFIX = '.seg'
+
+# Rows are tuples in posts column order; event_time (index 5) is stored as ISO text
+EVENT_TIME = 5
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot spool value of type {type(value).__name__}")
+
+def encode_rows(rows):
+    return zlib.compress(json.dumps(
+        [row[:EVENT_TIME] + (row[EVENT_TIME].isoformat(),) + row[EVENT_TIME + 1:] for row in rows],
+        separators=(',', ':'),
+        default=_json_default
+    ).encode('utf-8'))
+
+def decode_rows(payload):
+    return [
+        tuple(row[:EVENT_TIME]) + (datetime.fromisoformat(row[EVENT_TIME]),) + tuple(row[EVENT_TIME + 1:])
+        for row in json.loads(zlib.decompress(payload))
+    ]
+
+class Spool:
+    """
+    Append-only on-disk spool for batches that could not be written to Postgres.
+    Batches are stored as length-prefixed, checksummed records in numbered segment files.
+    Sealed segments are read back through mmap and deleted once fully replayed.
+    When the spool exceeds max_bytes, the oldest segments are evicted ('drop_oldest')
+    or new batches are refused ('reject_new').
+    """
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_bytes=512 * 1024 * 1024,
+                 eviction='drop_oldest'):
+        if eviction not in ('drop_oldest', 'reject_new'):
+            raise ValueError(f"Unknown spool eviction policy: {eviction}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_seq = None
+        self.evicted_segments = 0
+        self.rejected_batches = 0
+        self.replayed_rows = 0
+        self.last_replay_time = None
+        os.makedirs(directory, exist_ok=True)
+        segments = self._segments()
+        self._next_seq = segments[-1][0] + 1 if segments else 1
+
+    def _segments(self):
+        """Return (seq, path) pairs oldest first"""
+        segments = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX):
+                seq = int(filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                segments.append((seq, os.path.join(self.directory, filename)))
+        return sorted(segments)
+
+    def _size(self):
+        return sum(os.path.getsize(path) for _, path in self._segments())
+
+    def _seal_active(self):
+        if self._active:
+            self._active.close()
+            self._active = None
+            self._active_seq = None
+
+    def _open_segment(self):
+        self._active_seq = self._next_seq
+        self._next_seq += 1
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._active_seq:012d}{SEGMENT_SUFFIX}")
+        self._active = open(path, 'ab')
+
+    def _make_room(self, needed):
+        while self._size() + needed > self.max_bytes:
+            segments = [s for s in self._segments() if s[0] != self._active_seq]
+            if self.eviction == 'reject_new' or not segments:
+                return False
+            _, path = segments[0]
+            os.remove(path)
+            self.evicted_segments += 1
+            logger.warning(f"Spool over {self.max_bytes} bytes, evicted oldest segment {os.path.basename(path)}")
+        return True
+
+    def append(self, rows):
+        """Durably append a batch of rows. Returns False if the size cap refused it."""
+        payload = encode_rows(rows)
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if not self._make_room(len(record)):
+                self.rejected_batches += 1
+                logger.error(f"Spool full, rejected batch of {len(rows)} rows")
+                return False
+            if self._active is None or self._active.tell() + len(record) > self.segment_bytes:
+                self._seal_active()
+                self._open_segment()
+            self._active.write(record)
+            self._active.flush()
+            os.fsync(self._active.fileno())
+        logger.warning(f"Spooled {len(rows)} rows to {self.directory}")
+        return True
+
+    @staticmethod
+    def _read_segment(path):
+        """Yield decoded row batches from a segment, stopping at a torn or corrupt tail"""
+        if os.path.getsize(path) == 0:
+            return
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            offset = 0
+            while offset + RECORD_HEADER.size <= len(view):
+                length, crc = RECORD_HEADER.unpack_from(view, offset)
+                start = offset + RECORD_HEADER.size
+                payload = view[start:start + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    logger.error(f"Corrupt spool record in {os.path.basename(path)} at offset {offset}, skipping rest of segment")
+                    return
+                yield decode_rows(payload)
+                offset = start + length
+
+    def replay(self, store, key, max_rows=20000):
+        """
+        Drain the spool oldest segment first through store(rows), merging records into
+        batches of up to max_rows rows deduplicated by key. Stops at the first failed
+        store and leaves the remaining segments for the next run. Returns rows replayed.
+        """
+        with self._lock:
+            self._seal_active()
+            segments = self._segments()
+
+        replayed = 0
+        try:
+            for _, path in segments:
+                batch = {}
+                for rows in self._read_segment(path):
+                    for row in rows:
+                        batch[key(row)] = row
+                    if len(batch) >= max_rows:
+                        if not store(list(batch.values())):
+                            return replayed
+                        replayed += len(batch)
+                        batch = {}
+                if batch:
+                    if not store(list(batch.values())):
+                        return replayed
+                    replayed += len(batch)
+                with self._lock:
+                    os.remove(path)
+                logger.info(f"Replayed and removed spool segment {os.path.basename(path)}")
+            return replayed
+        finally:
+            with self._lock:
+                self.replayed_rows += replayed
+                self.last_replay_time = datetime.now()
+
+    def has_backlog(self):
+        with self._lock:
+            return bool(self._segments())
+
+    def stats(self):
+        with self._lock:
+            segments = self._segments()
+            return {
+                "segments": len(segments),
+                "backlog_bytes": sum(os.path.getsize(path) for _, path in segments),
+                "max_bytes": self.max_bytes,
+                "evicted_segments": self.evicted_segments,
+                "rejected_batches": self.rejected_batches,
+                "replayed_rows": self.replayed_rows,
+                "last_replay_time": self.last_replay_time.isoformat() if self.last_replay_time else None
+            }
@@ -0,0 +1,71 @@
+import base64
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def _jwt_expiry(token):
+    """Return the exp claim of a JWT bearer token, or None if it is not a JWT"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+        return float(exp) if exp is not None else None
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return None
+
+class TokenExpiredError(Exception):
+    """Raised when the API rejects the bearer token with 401"""
+
+class TokenCache:
+    """
+    Holds the current bearer token and its expiry so it can be reused across fetch cycles.
+    The expiry is taken from the login response (expires_in / expiresIn), from the JWT exp
+    claim, or from a configured TTL, and the token is treated as stale refresh_margin
+    seconds early so it is renewed before the API rejects it.
+    """
+
+    def __init__(self, ttl_seconds, refresh_margin_seconds, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._clock = clock
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def expires_at(self):
+        return self._expires_at if self._token else None
+
+    def get(self):
+        """Return the cached token if it is not due for refresh, otherwise None"""
+        with self._lock:
+            if self._token and self._clock() < self._expires_at - self.refresh_margin_seconds:
+                return self._token
+            return None
+
+    def store(self, token_data):
+        """Cache the token from a login response and return it"""
+        token = token_data.get("token") or token_data.get("access_token")
+        if not token:
+            return None
+
+        expires_in = token_data.get("expires_in") or token_data.get("expiresIn")
+        now = self._clock()
+        if expires_in:
+            expires_at = now + float(expires_in)
+        else:
+            expires_at = _jwt_expiry(token) or now + self.ttl_seconds
+
+        with self._lock:
+            self._token = token
+            self._expires_at = expires_at
+        logger.info(f"Cached access token, valid for {expires_at - now:.0f} seconds")
+        return token
+
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
@@ -0,0 +1,139 @@
+import gzip
+import json
+import logging
+import math
+import os
+import threading
+from array import array
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Positions in the posts row tuple (POSTS_COLUMNS order)
+ASSET_ID, EVENT_TIME, LATITUDE, LONGITUDE, STATUS_TEXT, TENANT = 0, 5, 6, 7, 8, 9
+
+EARTH_RADIUS_M = 6371008.8
+# Below this distance a heading is GPS jitter, not a turn
+HEADING_MIN_SEGMENT_M = 10.0
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def bearing_deg(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dlambda = math.radians(lon2 - lon1)
+    y = math.sin(dlambda) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlambda)
+    return math.degrees(math.atan2(y, x)) % 360.0
+
+class DeadBandCompressor:
+    """
+    Online per-asset dead-band filter for prepared rows. A row is kept when, compared with the
+    asset's last kept point, it moved at least min_distance_m, turned by at least min_heading_deg,
+    changed status, or max_gap_seconds passed. Per-asset state lives in parallel arrays indexed
+    by a slot number, so tens of thousands of assets cost a few dozen bytes each.
+    """
+
+    def __init__(self, min_distance_m=25.0, min_heading_deg=15.0, max_gap_seconds=600, initial_capacity=1024):
+        self.min_distance_m = min_distance_m
+        self.min_heading_deg = min_heading_deg
+        self.max_gap_seconds = max_gap_seconds
+        self._slots = {}
+        self._lat = array('d', bytes(8 * initial_capacity))
+        self._lon = array('d', bytes(8 * initial_capacity))
+        self._time = array('d', bytes(8 * initial_capacity))
+        # Heading of the segment that led to the last kept point, NaN if unknown
+        self._heading = array('d', [math.nan]) * initial_capacity
+        self._status = array('q', bytes(8 * initial_capacity))
+        self._lock = threading.Lock()
+        self.kept = 0
+        self.dropped = 0
+
+    def _grow(self):
+        size = len(self._lat)
+        for values in (self._lat, self._lon, self._time, self._status):
+            values.extend(array(values.typecode, bytes(values.itemsize * size)))
+        self._heading.extend(array('d', [math.nan]) * size)
+
+    def _remember(self, slot, lat, lon, ts, heading, status_hash):
+        self._lat[slot] = lat
+        self._lon[slot] = lon
+        self._time[slot] = ts
+        self._heading[slot] = heading
+        self._status[slot] = status_hash
+
+    def _keep(self, row):
+        lat, lon = row[LATITUDE], row[LONGITUDE]
+        if lat is None or lon is None or row[EVENT_TIME] is None:
+            return True
+        lat, lon = float(lat), float(lon)
+        ts = row[EVENT_TIME].timestamp()
+        status_hash = hash(row[STATUS_TEXT])
+        key = (row[TENANT], row[ASSET_ID])
+
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = len(self._slots)
+            if slot >= len(self._lat):
+                self._grow()
+            self._slots[key] = slot
+            self._remember(slot, lat, lon, ts, math.nan, status_hash)
+            return True
+
+        last_time = self._time[slot]
+        if ts <= last_time:
+            # Late or repeated report: pass through untouched, the upsert decides
+            return True
+
+        distance = haversine_m(self._lat[slot], self._lon[slot], lat, lon)
+        heading = bearing_deg(self._lat[slot], self._lon[slot], lat, lon) if distance >= HEADING_MIN_SEGMENT_M else math.nan
+        last_heading = self._heading[slot]
+        turned = (
+            not math.isnan(heading) and not math.isnan(last_heading)
+            and abs((heading - last_heading + 180.0) % 360.0 - 180.0) >= self.min_heading_deg
+        )
+        if (distance >= self.min_distance_m or turned
+                or ts - last_time >= self.max_gap_seconds
+                or status_hash != self._status[slot]):
+            self._remember(slot, lat, lon, ts, heading if not math.isnan(heading) else last_heading, status_hash)
+            return True
+        return False
+
+    def filter(self, rows):
+        """Return the rows worth storing, in their original order."""
+        with self._lock:
+            kept = [row for row in rows if self._keep(row)]
+            self.kept += len(kept)
+            self.dropped += len(rows) - len(kept)
+        return kept
+
+    def stats(self):
+        return {
+            "tracked_assets": len(self._slots),
+            "kept": self.kept,
+            "dropped": self.dropped,
+        }
+
+class RawArchive:
+    """Appends every raw prepared row to a daily gzip NDJSON file before compression."""
+
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = columns
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, rows):
+        if not rows:
+            return
+        path = os.path.join(self.directory, f"raw-{datetime.now(timezone.utc):%Y-%m-%d}.ndjson.gz")
+        lines = ''.join(json.dumps(dict(zip(self.columns, row)), default=str) + '\n' for row in rows)
+        try:
+            with self._lock, gzip.open(path, 'at', encoding='utf-8') as f:
+                f.write(lines)
+        except OSError as e:
+            logger.error(f"Could not archive {len(rows)} raw rows to {path}: {e}")
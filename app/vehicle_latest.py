@@ -0,0 +1,76 @@
+import logging
+from psycopg2.extras import execute_values
+from dimensions import POSITION_COLUMNS, position_rows
+
+logger = logging.getLogger(__name__)
+
+# Positions in the posts row tuple (POSTS_COLUMNS order)
+ASSET_ID = 0
+EVENT_TIME = 5
+TENANT = 9
+
+# Same narrow layout as posts: asset attributes live in assets, statuses in status_codes
+VEHICLE_LATEST_COLUMNS = POSITION_COLUMNS
+
+# Only move a vehicle forward in time, so replayed or late batches never overwrite a newer position
+VEHICLE_LATEST_CONFLICT_CLAUSE = """
+    ON CONFLICT (tenant, asset_id) DO UPDATE
+    SET
+        position_description = EXCLUDED.position_description,
+        event_time = EXCLUDED.event_time,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        status_id = EXCLUDED.status_id,
+        updated_at = now()
+    WHERE vehicle_latest.event_time < EXCLUDED.event_time
+"""
+
+def latest_positions(rows):
+    """Newest row per (tenant, asset_id); ON CONFLICT cannot touch the same key twice in one statement."""
+    latest = {}
+    for row in rows:
+        key = (row[TENANT], row[ASSET_ID])
+        current = latest.get(key)
+        if current is None or row[EVENT_TIME] > current[EVENT_TIME]:
+            latest[key] = row
+    return list(latest.values())
+
+def update_vehicle_latest(cursor, rows, status_ids):
+    """Advance vehicle_latest from stored prepared rows, in the caller's transaction."""
+    positions = latest_positions(rows)
+    if not positions:
+        return
+    execute_values(
+        cursor,
+        f"INSERT INTO vehicle_latest ({', '.join(VEHICLE_LATEST_COLUMNS)}) VALUES %s" + VEHICLE_LATEST_CONFLICT_CLAUSE,
+        position_rows(positions, status_ids)
+    )
+
+VEHICLE_LATEST_ASYNC_SQL = (
+    f"INSERT INTO vehicle_latest ({', '.join(VEHICLE_LATEST_COLUMNS)}) "
+    f"VALUES ({', '.join(f'${i}' for i in range(1, len(VEHICLE_LATEST_COLUMNS) + 1))})"
+    + VEHICLE_LATEST_CONFLICT_CLAUSE
+)
+
+async def update_vehicle_latest_async(conn, rows, status_ids):
+    """asyncpg variant of update_vehicle_latest, run inside the writer's transaction."""
+    positions = latest_positions(rows)
+    if positions:
+        await conn.executemany(VEHICLE_LATEST_ASYNC_SQL, position_rows(positions, status_ids))
+
+def fetch_vehicle_latest(cursor, tenant=None):
+    """All current vehicle positions, optionally for one tenant, as dicts."""
+    columns = ('tenant', 'asset_id', 'name', 'plate_number', 'vin', 'position_description',
+               'event_time', 'latitude', 'longitude', 'status_text', 'updated_at')
+    query = """
+        SELECT v.tenant, v.asset_id, a.name, a.plate_number, a.vin, v.position_description,
+               v.event_time, v.latitude, v.longitude, s.status_text, v.updated_at
+        FROM vehicle_latest v
+        LEFT JOIN assets a USING (tenant, asset_id)
+        LEFT JOIN status_codes s ON s.id = v.status_id
+    """
+    if tenant is not None:
+        cursor.execute(query + " WHERE v.tenant = %s ORDER BY v.asset_id", (tenant,))
+    else:
+        cursor.execute(query + " ORDER BY v.tenant, v.asset_id")
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -0,0 +1,65 @@
+import math
+
+# Must match posts_zorder() in db-init/init_db.py: 31 bits per axis, latitude on the even bits
+BITS = 31
+SCALE = 1 << BITS
+MAX_Q = SCALE - 1
+
+def _spread(x):
+    """Insert a zero bit between each of the 31 low bits of x."""
+    x = (x | (x << 16)) & 0x0000FFFF0000FFFF
+    x = (x | (x << 8)) & 0x00FF00FF00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F0F0F0F0F
+    x = (x | (x << 2)) & 0x3333333333333333
+    x = (x | (x << 1)) & 0x5555555555555555
+    return x
+
+def quantize_latitude(latitude):
+    return min(max(math.floor((latitude + 90.0) / 180.0 * SCALE), 0), MAX_Q)
+
+def quantize_longitude(longitude):
+    return min(max(math.floor((longitude + 180.0) / 360.0 * SCALE), 0), MAX_Q)
+
+def interleave(lat_q, lon_q):
+    return _spread(lat_q) | (_spread(lon_q) << 1)
+
+def zorder(latitude, longitude):
+    return interleave(quantize_latitude(latitude), quantize_longitude(longitude))
+
+def bbox_ranges(min_lat, min_lon, max_lat, max_lon, extra_levels=2):
+    """
+    Cover a bounding box with sorted, merged (low, high) Z-order ranges. Cells are split down
+    to about a quarter of the box size, so the cover stays within a few dozen ranges and the
+    exact latitude/longitude filter only has to discard the edges.
+    """
+    # One quantum of padding absorbs float vs numeric rounding differences at the edges
+    y_lo, y_hi = max(quantize_latitude(min_lat) - 1, 0), min(quantize_latitude(max_lat) + 1, MAX_Q)
+    x_lo, x_hi = max(quantize_longitude(min_lon) - 1, 0), min(quantize_longitude(max_lon) + 1, MAX_Q)
+    span = max(y_hi - y_lo, x_hi - x_lo, 1)
+    max_level = min(BITS, max(0, BITS - span.bit_length()) + extra_levels)
+
+    ranges = []
+
+    def cover(level, y0, x0):
+        size = 1 << (BITS - level)
+        y1, x1 = y0 + size - 1, x0 + size - 1
+        if y1 < y_lo or y0 > y_hi or x1 < x_lo or x0 > x_hi:
+            return
+        inside = y_lo <= y0 and y1 <= y_hi and x_lo <= x0 and x1 <= x_hi
+        if inside or level >= max_level:
+            ranges.append((interleave(y0, x0), interleave(y1, x1)))
+            return
+        half = size >> 1
+        # Children in Z order: latitude is the low bit of each pair
+        for dy, dx in ((0, 0), (half, 0), (0, half), (half, half)):
+            cover(level + 1, y0 + dy, x0 + dx)
+
+    cover(0, 0, 0)
+
+    merged = []
+    for low, high in ranges:
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
@@ -0,0 +1,90 @@
+"""
+Compare the vectorized NumPy trip metrics in geo_analytics with a row-by-row Python loop.
+
+Usage:
+    python benchmarks/geo_analytics_benchmark.py [points] [assets]
+
+No database is needed; positions are generated in memory.
+"""
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import numpy as np
+from geo_analytics import compute_metrics, EARTH_RADIUS_M
+
+def synthetic_positions(points, assets):
+    rng = np.random.default_rng(42)
+    per_asset = points // assets
+    asset_ids = np.repeat(np.arange(assets), per_asset)
+    times = np.tile(np.arange(per_asset) * 60.0, assets) + 1.7e9
+    # Alternate driving and parked stretches of 30 minutes
+    driving = (np.tile(np.arange(per_asset), assets) // 30) % 2 == 0
+    steps = np.where(driving, rng.normal(0.003, 0.001, len(asset_ids)), rng.normal(0, 1e-6, len(asset_ids)))
+    lats = 49.6 + np.cumsum(steps.reshape(assets, per_asset), axis=1).ravel() * 0.1
+    lons = 6.1 + np.cumsum(steps.reshape(assets, per_asset), axis=1).ravel() * 0.1
+    return asset_ids, times, lats, lons
+
+def python_metrics(asset_ids, times, lats, lons, stop_speed_mps=0.5, min_stop_seconds=300):
+    """Reference implementation: one haversine per row pair in a plain loop."""
+    results = {}
+    previous = None
+    stop_start = None
+    for asset_id, ts, lat, lon in zip(asset_ids, times, lats, lons):
+        if previous is None or previous[0] != asset_id:
+            if previous is not None and stop_start is not None and previous[1] - stop_start >= min_stop_seconds:
+                results[previous[0]]["stops"] += 1
+            results[asset_id] = {"distance_m": 0.0, "moving_s": 0.0, "max_speed": 0.0, "stops": 0}
+            previous, stop_start = (asset_id, ts, lat, lon), None
+            continue
+        phi1, phi2 = math.radians(previous[2]), math.radians(lat)
+        a = (math.sin((phi2 - phi1) / 2) ** 2
+             + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon - previous[3]) / 2) ** 2)
+        distance = 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+        elapsed = ts - previous[1]
+        speed = distance / elapsed if elapsed > 0 else 0.0
+        metrics = results[asset_id]
+        metrics["distance_m"] += distance
+        metrics["max_speed"] = max(metrics["max_speed"], speed)
+        if speed < stop_speed_mps:
+            if stop_start is None:
+                stop_start = previous[1]
+        else:
+            metrics["moving_s"] += elapsed
+            if stop_start is not None and previous[1] - stop_start >= min_stop_seconds:
+                metrics["stops"] += 1
+            stop_start = None
+        previous = (asset_id, ts, lat, lon)
+    if previous is not None and stop_start is not None and previous[1] - stop_start >= min_stop_seconds:
+        results[previous[0]]["stops"] += 1
+    return results
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    assets = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    asset_ids, times, lats, lons = synthetic_positions(points, assets)
+    rows = (asset_ids.tolist(), times.tolist(), lats.tolist(), lons.tolist())
+
+    started = time.perf_counter()
+    reference = python_metrics(*rows)
+    python_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectorized = compute_metrics(asset_ids, times, lats, lons)
+    numpy_elapsed = time.perf_counter() - started
+
+    for asset_id, expected in reference.items():
+        actual = vectorized[asset_id]
+        assert abs(actual["distance_m"] - expected["distance_m"]) < 1.0, asset_id
+        assert len(actual["stops"]) == expected["stops"], asset_id
+
+    print(f"{len(asset_ids)} points, {assets} assets")
+    print(f"{'python loop':>12}: {python_elapsed:.2f}s -> {len(asset_ids) / python_elapsed:,.0f} points/sec")
+    print(f"{'numpy':>12}: {numpy_elapsed:.2f}s -> {len(asset_ids) / numpy_elapsed:,.0f} points/sec")
+    print(f"{'speedup':>12}: {python_elapsed / numpy_elapsed:.1f}x")
+
+if __name__ == "__main__":
+    main()
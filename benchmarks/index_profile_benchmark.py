@@ -0,0 +1,129 @@
+"""
+Compare ingest rate and query latency of the btree and brin posts index profiles
+against a local Postgres.
+
+Usage:
+    POSTGRES_HOST=localhost POSTGRES_USER=dbuser POSTGRES_PASSWORD=password POSTGRES_DB=apidata \
+        python benchmarks/index_profile_benchmark.py [rows] [batch_size] [queries]
+
+The benchmark works in a scratch schema (bench_index) which is dropped afterwards.
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import psycopg2
+from main import upsert_values
+from ingest_benchmark import synthetic_rows, STATUS_IDS
+
+SCHEMA = 'bench_index'
+
+PROFILES = {
+    'btree': (
+        "CREATE INDEX idx_posts_bench_event_time ON posts_bench (event_time)",
+        "CREATE INDEX idx_posts_bench_asset_id ON posts_bench (asset_id)",
+    ),
+    'brin': (
+        "CREATE INDEX idx_posts_bench_event_time_brin ON posts_bench USING brin (event_time) WITH (pages_per_range = 32)",
+    ),
+}
+
+QUERIES = {
+    'time range (1h)': (
+        "SELECT count(*) FROM posts WHERE event_time >= %(start)s AND event_time < %(start)s + interval '1 hour'"
+    ),
+    'asset track (1d)': (
+        "SELECT event_time, latitude, longitude FROM posts "
+        "WHERE tenant = 'default' AND asset_id = %(asset_id)s "
+        "AND event_time >= %(start)s AND event_time < %(start)s + interval '1 day' ORDER BY event_time"
+    ),
+}
+
+def setup_schema(conn, start, profile):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute("""
+            CREATE TABLE posts (
+                id SERIAL,
+                asset_id INTEGER NOT NULL,
+                position_description TEXT,
+                event_time TIMESTAMPTZ NOT NULL,
+                latitude DOUBLE PRECISION,
+                longitude DOUBLE PRECISION,
+                status_id SMALLINT,
+                tenant TEXT NOT NULL DEFAULT 'default',
+                PRIMARY KEY (tenant, asset_id, event_time)
+            ) PARTITION BY RANGE (event_time)
+        """)
+        cur.execute(
+            "CREATE TABLE posts_bench PARTITION OF posts FOR VALUES FROM (%s) TO (%s)",
+            (start - timedelta(days=1), start + timedelta(days=365))
+        )
+        for statement in PROFILES[profile]:
+            cur.execute(statement)
+    conn.commit()
+
+def ingest(conn, rows, batch_size):
+    started = time.perf_counter()
+    for offset in range(0, len(rows), batch_size):
+        with conn.cursor() as cur:
+            upsert_values(cur, rows[offset:offset + batch_size], STATUS_IDS)
+        conn.commit()
+    return time.perf_counter() - started
+
+def query_latencies(conn, start, span_seconds, queries):
+    rng = random.Random(42)
+    params = [
+        {'start': start + timedelta(seconds=rng.randrange(span_seconds)), 'asset_id': rng.randrange(5000)}
+        for _ in range(queries)
+    ]
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE posts")
+        results = {}
+        for label, query in QUERIES.items():
+            started = time.perf_counter()
+            for p in params:
+                cur.execute(query, p)
+                cur.fetchall()
+            results[label] = (time.perf_counter() - started) / queries
+        cur.execute("SELECT pg_indexes_size('posts_bench')")
+        index_bytes = cur.fetchone()[0]
+    conn.commit()
+    return results, index_bytes
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = synthetic_rows(total, start)
+
+    conn = psycopg2.connect(
+        host=os.getenv('POSTGRES_HOST', 'localhost'),
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        database=os.getenv('POSTGRES_DB')
+    )
+    try:
+        for profile in PROFILES:
+            setup_schema(conn, start, profile)
+            elapsed = ingest(conn, rows, batch_size)
+            latencies, index_bytes = query_latencies(conn, start, total, queries)
+            print(f"{profile:>6}: {total / elapsed:,.0f} rows/sec, indexes {index_bytes / 1024 / 1024:.1f} MiB")
+            for label, seconds in latencies.items():
+                print(f"{'':>8}{label:<18} {seconds * 1000:.2f} ms/query")
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare rows/sec of the execute_values and COPY ingest paths against a local Postgres.
+
+Usage:
+    POSTGRES_HOST=localhost POSTGRES_USER=dbuser POSTGRES_PASSWORD=password POSTGRES_DB=apidata \
+        python benchmarks/ingest_benchmark.py [rows] [batch_size]
+
+The benchmark works in a scratch schema (bench_ingest) which is dropped afterwards.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import psycopg2
+from main import upsert_values, upsert_copy
+
+SCHEMA = 'bench_ingest'
+
+# status_codes ids for the synthetic status texts
+STATUS_IDS = {'Driving': 1, 'Parked': 2}
+
+def synthetic_rows(count, start):
+    return [
+        (
+            i % 5000,
+            f"Vehicle {i % 5000}",
+            f"LU-{i % 5000:05d}",
+            f"VIN{i % 5000:014d}",
+            f"Rue de la Gare {i % 97}, Luxembourg",
+            start + timedelta(seconds=i),
+            49.6 + (i % 1000) / 100000,
+            6.1 + (i % 1000) / 100000,
+            'Driving' if i % 3 else 'Parked',
+            'default'
+        )
+        for i in range(count)
+    ]
+
+def setup_schema(conn, start):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute("""
+            CREATE TABLE posts (
+                id SERIAL,
+                asset_id INTEGER NOT NULL,
+                position_description TEXT,
+                event_time TIMESTAMPTZ NOT NULL,
+                latitude DOUBLE PRECISION,
+                longitude DOUBLE PRECISION,
+                status_id SMALLINT,
+                tenant TEXT NOT NULL DEFAULT 'default',
+                PRIMARY KEY (tenant, asset_id, event_time)
+            ) PARTITION BY RANGE (event_time)
+        """)
+        cur.execute(
+            "CREATE TABLE posts_bench PARTITION OF posts FOR VALUES FROM (%s) TO (%s)",
+            (start - timedelta(days=1), start + timedelta(days=365))
+        )
+    conn.commit()
+
+def run(conn, writer, rows, batch_size):
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE posts")
+    conn.commit()
+    started = time.perf_counter()
+    for offset in range(0, len(rows), batch_size):
+        with conn.cursor() as cur:
+            writer(cur, rows[offset:offset + batch_size], STATUS_IDS)
+        conn.commit()
+    return time.perf_counter() - started
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = synthetic_rows(total, start)
+
+    conn = psycopg2.connect(
+        host=os.getenv('POSTGRES_HOST', 'localhost'),
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        database=os.getenv('POSTGRES_DB')
+    )
+    try:
+        setup_schema(conn, start)
+        for label, writer in (('execute_values', upsert_values), ('copy', upsert_copy)):
+            elapsed = run(conn, writer, rows, batch_size)
+            print(f"{label:>15}: {total} rows in {elapsed:.2f}s -> {total / elapsed:,.0f} rows/sec")
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
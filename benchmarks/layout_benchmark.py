@@ -0,0 +1,153 @@
+"""
+Compare the previous wide posts layout (DECIMAL coordinates, asset attributes and status text on
+every row) with the narrow layout (assets dimension, status_codes, double precision coordinates):
+ingest rows/sec and on-disk size per million rows, against a local Postgres.
+
+Usage:
+    POSTGRES_HOST=localhost POSTGRES_USER=dbuser POSTGRES_PASSWORD=password POSTGRES_DB=apidata \
+        python benchmarks/layout_benchmark.py [rows] [batch_size]
+
+The benchmark works in a scratch schema (bench_layout) which is dropped afterwards.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import psycopg2
+from psycopg2.extras import execute_values
+from main import POSTS_COLUMNS, upsert_values
+from dimensions import Dimensions
+from ingest_benchmark import synthetic_rows
+
+SCHEMA = 'bench_layout'
+
+WIDE_SCHEMA = """
+    CREATE TABLE posts (
+        id SERIAL,
+        asset_id INTEGER NOT NULL,
+        name TEXT,
+        plate_number TEXT,
+        vin TEXT,
+        position_description TEXT,
+        event_time TIMESTAMPTZ NOT NULL,
+        latitude DECIMAL(10,8),
+        longitude DECIMAL(11,8),
+        status_text TEXT,
+        tenant TEXT NOT NULL DEFAULT 'default',
+        PRIMARY KEY (tenant, asset_id, event_time)
+    ) PARTITION BY RANGE (event_time)
+"""
+
+WIDE_UPSERT = f"""
+    INSERT INTO posts ({', '.join(POSTS_COLUMNS)}) VALUES %s
+    ON CONFLICT ON CONSTRAINT posts_pkey DO UPDATE
+    SET
+        name = EXCLUDED.name,
+        plate_number = EXCLUDED.plate_number,
+        vin = EXCLUDED.vin,
+        position_description = EXCLUDED.position_description,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        status_text = EXCLUDED.status_text
+"""
+
+NARROW_SCHEMA = """
+    CREATE TABLE posts (
+        id SERIAL,
+        asset_id INTEGER NOT NULL,
+        position_description TEXT,
+        event_time TIMESTAMPTZ NOT NULL,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        status_id SMALLINT,
+        tenant TEXT NOT NULL DEFAULT 'default',
+        PRIMARY KEY (tenant, asset_id, event_time)
+    ) PARTITION BY RANGE (event_time);
+    CREATE TABLE assets (
+        tenant TEXT NOT NULL DEFAULT 'default',
+        asset_id INTEGER NOT NULL,
+        name TEXT,
+        plate_number TEXT,
+        vin TEXT,
+        updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (tenant, asset_id)
+    );
+    CREATE TABLE status_codes (
+        id SMALLSERIAL PRIMARY KEY,
+        status_text TEXT NOT NULL UNIQUE
+    );
+"""
+
+def setup_schema(conn, start, ddl):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute(ddl)
+        cur.execute(
+            "CREATE TABLE posts_bench PARTITION OF posts FOR VALUES FROM (%s) TO (%s)",
+            (start - timedelta(days=1), start + timedelta(days=365))
+        )
+    conn.commit()
+
+def store_wide(conn, batch):
+    with conn.cursor() as cur:
+        execute_values(cur, WIDE_UPSERT, batch)
+    conn.commit()
+
+def narrow_writer():
+    dimensions = Dimensions()
+
+    def store_narrow(conn, batch):
+        with conn.cursor() as cur:
+            status_ids, pending = dimensions.prepare(cur, batch)
+            upsert_values(cur, batch, status_ids)
+        conn.commit()
+        dimensions.remember(pending)
+    return store_narrow
+
+def run(conn, store, rows, batch_size):
+    started = time.perf_counter()
+    for offset in range(0, len(rows), batch_size):
+        store(conn, rows[offset:offset + batch_size])
+    elapsed = time.perf_counter() - started
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT coalesce(sum(pg_total_relation_size(c.oid)), 0)
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relkind = 'r'
+        """, (SCHEMA,))
+        total_bytes = cur.fetchone()[0]
+    conn.commit()
+    return elapsed, total_bytes
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = synthetic_rows(total, start)
+
+    conn = psycopg2.connect(
+        host=os.getenv('POSTGRES_HOST', 'localhost'),
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        database=os.getenv('POSTGRES_DB')
+    )
+    try:
+        for label, ddl, store in (('wide', WIDE_SCHEMA, store_wide), ('narrow', NARROW_SCHEMA, narrow_writer())):
+            setup_schema(conn, start, ddl)
+            elapsed, total_bytes = run(conn, store, rows, batch_size)
+            print(f"{label:>7}: {total / elapsed:,.0f} rows/sec, "
+                  f"{total_bytes / total * 1000000 / 1024 / 1024:.1f} MiB per million rows (tables + indexes)")
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Microbenchmark for the row representation produced by prepare_vehicle_status_data.
+
+Usage:
+    python benchmarks/prepare_benchmark.py [assets] [repeats]
+
+Compares the previous dict-per-row preparation (merged from **base_data and then
+converted to a tuple for the writer) against the current tuple rows, reporting
+time per row and retained bytes per row. Both paths parse txDateTime with
+parse_tx_datetime (its cache cleared before every run), so the difference is the
+row representation alone.
+"""
+import os
+import sys
+import time
+import tracemalloc
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+from main import DEFAULT_TENANT, parse_tx_datetime, prepare_vehicle_status_data
+
+def synthetic_payload(count):
+    return [
+        {
+            'id': i,
+            'name': f"Vehicle {i}",
+            'plateNumber': f"LU-{i:06d}",
+            'vin': f"VIN{i:014d}",
+            'statusList': [
+                {
+                    'id': status_id,
+                    'statusText': 'Driving' if status_id else 'Parked',
+                    'position': {
+                        'txDateTime': f"2024-05-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:{status_id * 7:02d}Z",
+                        'description': f"Rue de la Gare {i % 97}, Luxembourg",
+                        'coordinates': {'latitude': 49.6 + (i % 1000) / 100000, 'longitude': 6.1 + (i % 1000) / 100000}
+                    }
+                }
+                for status_id in (0, 1)
+            ]
+        }
+        for i in range(count)
+    ]
+
+def legacy_prepare(json_data):
+    """The dict-based preparation plus dict-to-tuple conversion used before tuple rows."""
+    prepared_data = []
+    seen_keys = set()
+    for vehicle in json_data:
+        base_data = {
+            'asset_id': vehicle['id'],
+            'name': vehicle['name'],
+            'plate_number': vehicle.get('plateNumber', ''),
+            'vin': vehicle.get('vin', '')
+        }
+        for status in vehicle['statusList']:
+            if status['id'] in [0, 1]:
+                event_time = parse_tx_datetime(status['position']['txDateTime'])
+                unique_key = (vehicle['id'], event_time)
+                if unique_key in seen_keys:
+                    continue
+                seen_keys.add(unique_key)
+                prepared_data.append({
+                    **base_data,
+                    'position_description': status['position']['description'],
+                    'event_time': event_time,
+                    'latitude': status['position']['coordinates']['latitude'],
+                    'longitude': status['position']['coordinates']['longitude'],
+                    'status_text': status['statusText']
+                })
+    return [
+        (
+            item['asset_id'], item['name'], item['plate_number'], item['vin'],
+            item['position_description'], item['event_time'], item['latitude'],
+            item['longitude'], item['status_text'], DEFAULT_TENANT
+        )
+        for item in prepared_data
+    ], prepared_data
+
+def measure(label, func, payload, repeats):
+    best = None
+    for _ in range(repeats):
+        parse_tx_datetime.cache_clear()
+        started = time.perf_counter()
+        result = func(payload)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        del result
+
+    parse_tx_datetime.cache_clear()
+    tracemalloc.start()
+    result = func(payload)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = len(result[0]) if isinstance(result, tuple) else len(result)
+    print(f"{label:>7}: {best / rows * 1e6:.2f} us/row, {retained / rows:.0f} bytes/row retained ({rows} rows)")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    logging.getLogger().setLevel(logging.WARNING)
+    payload = synthetic_payload(count)
+    measure('dict', legacy_prepare, payload, repeats)
+    measure('tuple', prepare_vehicle_status_data, payload, repeats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare peak memory of the full-body and streaming /v1/assets/ parse paths.
+
+Usage:
+    python benchmarks/streaming_memory_benchmark.py [assets] [batch_size]
+
+A synthetic payload is written to a temporary file and parsed twice: once with
+json.load + prepare_vehicle_status_data, once with ijson + iter_vehicle_status_data
+feeding iter_batches. Peak Python heap is measured with tracemalloc.
+"""
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import ijson
+import logging
+from main import prepare_vehicle_status_data, iter_vehicle_status_data, iter_batches
+
+def synthetic_asset(i):
+    return {
+        'id': i,
+        'name': f"Vehicle {i}",
+        'plateNumber': f"LU-{i:06d}",
+        'vin': f"VIN{i:014d}",
+        'statusList': [
+            {
+                'id': status_id,
+                'statusText': 'Driving' if status_id else 'Parked',
+                'position': {
+                    'txDateTime': f"2024-05-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:{status_id * 7:02d}Z",
+                    'description': f"Rue de la Gare {i % 97}, Luxembourg",
+                    'coordinates': {'latitude': 49.6 + (i % 1000) / 100000, 'longitude': 6.1 + (i % 1000) / 100000}
+                }
+            }
+            for status_id in (0, 1, 2)
+        ]
+    }
+
+def write_payload(path, count):
+    with open(path, 'w') as f:
+        f.write('[')
+        for i in range(count):
+            if i:
+                f.write(',')
+            json.dump(synthetic_asset(i), f)
+        f.write(']')
+
+def measure(label, func):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    rows = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>10}: {rows} rows in {elapsed:.2f}s, peak {peak / 1024 / 1024:.1f} MiB")
+
+def full_body(path):
+    with open(path, 'rb') as f:
+        body = f.read()
+    return len(prepare_vehicle_status_data(json.loads(body)))
+
+def streaming(path, batch_size):
+    rows = 0
+    with open(path, 'rb') as f:
+        vehicles = ijson.items(f, 'item', use_float=True)
+        for batch in iter_batches(iter_vehicle_status_data(vehicles), batch_size):
+            rows += len(batch)
+    return rows
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'assets.json')
+        write_payload(path, count)
+        print(f"Payload: {count} assets, {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+        measure('full', lambda: full_body(path))
+        measure('streaming', lambda: streaming(path, batch_size))
+
+if __name__ == "__main__":
+    main()
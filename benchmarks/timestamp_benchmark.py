@@ -0,0 +1,49 @@
+"""
+Compare txDateTime parsing: strptime + pytz.UTC.localize versus parse_tx_datetime.
+
+Usage:
+    python benchmarks/timestamp_benchmark.py [timestamps] [distinct]
+
+The input repeats `distinct` different strings, mirroring how parked vehicles
+report the same txDateTime on every poll.
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import pytz
+from main import parse_tx_datetime
+
+def legacy_parse(value):
+    return pytz.UTC.localize(datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ'))
+
+def timed(func, values):
+    started = time.perf_counter()
+    for value in values:
+        func(value)
+    return time.perf_counter() - started
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    values = [
+        f"2024-05-{1 + i % 28:02d}T{i % 24:02d}:{(i // 24) % 60:02d}:{i % 60:02d}Z"
+        for i in (n % distinct for n in range(total))
+    ]
+    assert all(legacy_parse(v) == parse_tx_datetime(v) for v in values[:distinct])
+
+    legacy = timed(legacy_parse, values)
+    parse_tx_datetime.cache_clear()
+    fast = timed(parse_tx_datetime, values)
+    parse_tx_datetime.cache_clear()
+    uncached = timed(parse_tx_datetime.__wrapped__, values)
+
+    print(f"strptime+localize: {legacy / total * 1e6:.2f} us/value")
+    print(f"fast (no cache):   {uncached / total * 1e6:.2f} us/value ({legacy / uncached:.1f}x)")
+    print(f"fast (cached):     {fast / total * 1e6:.2f} us/value ({legacy / fast:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,13 @@
+"""
+Creates and migrates the database schema. Every statement is idempotent, so the script is
+also the migration for an existing database; docker-entrypoint-initdb.d only runs it on an
+empty volume, so after upgrading run it against the live database with
+
+    docker compose exec db python3 /docker-entrypoint-initdb.d/init_db.py
+
+The app refuses to start until partition_config.schema_version is at least its
+REQUIRED_SCHEMA_VERSION.
+"""
 import os
 import psycopg2
 import logging
@@ -6,6 +16,9 @@ from time import sleep
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Recorded in partition_config once the schema is complete; bump with every schema change
+SCHEMA_VERSION = 1
+
 def wait_for_db(dsn, max_attempts=60, wait_seconds=2):
     """Wait for database to become available"""
     for attempt in range(max_attempts):
@@ -38,6 +51,16 @@ def init_database():
     app_db = os.getenv('POSTGRES_DB', 'apidata')
 
     timezone = os.getenv('POSTGRES_TZ', 'Europe/Berlin')
+
+    partition_granularity = os.getenv('PARTITION_GRANULARITY', 'monthly').lower()
+    if partition_granularity not in ('daily', 'weekly', 'monthly'):
+        raise ValueError(f"Unsupported PARTITION_GRANULARITY: {partition_granularity}")
+
+    # brin: BRIN on event_time, asset lookups served by the primary key
+    # btree: the previous separate B-tree indexes on event_time and asset_id
+    index_profile = os.getenv('POSTS_INDEX_PROFILE', 'brin').lower()
+    if index_profile not in ('brin', 'btree'):
+        raise ValueError(f"Unsupported POSTS_INDEX_PROFILE: {index_profile}")
     
     dsn = f"dbname=postgres user={db_config['user']} password={db_config['password']} host={db_config['host']}"
     if not wait_for_db(dsn):
@@ -157,99 +180,403 @@ def init_database():
             CREATE TABLE IF NOT EXISTS posts (
                 id SERIAL,
                 asset_id INTEGER NOT NULL,
-                name TEXT,
-                plate_number TEXT,
-                vin TEXT,
                 position_description TEXT,
                 event_time TIMESTAMPTZ NOT NULL,
-                latitude DECIMAL(10,8),
-                longitude DECIMAL(11,8),
-                status_text TEXT,
-                PRIMARY KEY (asset_id, event_time)
+                latitude DOUBLE PRECISION,
+                longitude DOUBLE PRECISION,
+                status_id SMALLINT,
+                tenant TEXT NOT NULL DEFAULT 'default',
+                PRIMARY KEY (tenant, asset_id, event_time)
             ) PARTITION BY RANGE (event_time);
         """)
 
-        logger.info("Creating partition management function...")
+        logger.info("Migrating posts to per-tenant primary key...")
+        cur.execute("ALTER TABLE posts ADD COLUMN IF NOT EXISTS tenant TEXT NOT NULL DEFAULT 'default';")
         cur.execute("""
-            CREATE OR REPLACE FUNCTION manage_partitions() 
-            RETURNS void AS $$
-            DECLARE
-                current_partition text;
-                next_partition text;
-                partition_start date;
-                partition_end date;
+            DO $$
             BEGIN
-                partition_start := date_trunc('month', CURRENT_DATE);
-                partition_end := partition_start + interval '1 month';
-                
-                current_partition := format('posts_%s_%s',
-                    to_char(partition_start, 'YYYY'),
-                    to_char(partition_start, 'MM'));
-                next_partition := format('posts_%s_%s',
-                    to_char(partition_end, 'YYYY'),
-                    to_char(partition_end, 'MM'));
-                    
                 IF NOT EXISTS (
-                    SELECT FROM pg_class c 
-                    JOIN pg_namespace n ON n.oid = c.relnamespace
-                    WHERE c.relname = current_partition
+                    SELECT FROM pg_constraint c
+                    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+                    WHERE c.conname = 'posts_pkey' AND a.attname = 'tenant'
                 ) THEN
-                    EXECUTE format(
-                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF posts 
-                         FOR VALUES FROM (%L) TO (%L)',
-                        current_partition,
-                        partition_start,
-                        partition_end
-                    );
-                    
-                    EXECUTE format(
-                        'CREATE INDEX IF NOT EXISTS %I ON %I (event_time)',
-                        'idx_' || current_partition || '_event_time',
-                        current_partition
-                    );
-                    
-                    EXECUTE format(
-                        'CREATE INDEX IF NOT EXISTS %I ON %I (asset_id)',
-                        'idx_' || current_partition || '_asset_id',
-                        current_partition
-                    );
-                    
+                    ALTER TABLE posts DROP CONSTRAINT IF EXISTS posts_pkey;
+                    ALTER TABLE posts ADD CONSTRAINT posts_pkey PRIMARY KEY (tenant, asset_id, event_time);
+                END IF;
+            END $$;
+        """)
+
+        logger.info("Creating assets dimension and status dictionary...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS assets (
+                tenant TEXT NOT NULL DEFAULT 'default',
+                asset_id INTEGER NOT NULL,
+                name TEXT,
+                plate_number TEXT,
+                vin TEXT,
+                updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (tenant, asset_id)
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS status_codes (
+                id SMALLSERIAL PRIMARY KEY,
+                status_text TEXT NOT NULL UNIQUE
+            );
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION posts_status_id(status text)
+            RETURNS smallint AS $$
+                SELECT id FROM status_codes WHERE status_text = status;
+            $$ LANGUAGE sql STABLE;
+        """)
+
+        logger.info("Migrating posts to the narrow layout...")
+        # One rewrite per partition: the repeated asset attributes move to assets, status_text
+        # becomes a status_codes id and the coordinates become double precision
+        cur.execute("""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = 'posts' AND column_name = 'status_text'
+                ) THEN
+                    INSERT INTO status_codes (status_text)
+                    SELECT DISTINCT status_text FROM posts WHERE status_text IS NOT NULL
+                    ON CONFLICT (status_text) DO NOTHING;
+
+                    INSERT INTO assets (tenant, asset_id, name, plate_number, vin)
+                    SELECT DISTINCT ON (tenant, asset_id) tenant, asset_id, name, plate_number, vin
+                    FROM posts
+                    ORDER BY tenant, asset_id, event_time DESC
+                    ON CONFLICT (tenant, asset_id) DO NOTHING;
+
+                    ALTER TABLE posts DROP COLUMN IF EXISTS zorder;
+                    ALTER TABLE posts
+                        DROP COLUMN name,
+                        DROP COLUMN plate_number,
+                        DROP COLUMN vin,
+                        ALTER COLUMN latitude TYPE double precision,
+                        ALTER COLUMN longitude TYPE double precision,
+                        ALTER COLUMN status_text TYPE smallint USING posts_status_id(status_text);
+                    ALTER TABLE posts RENAME COLUMN status_text TO status_id;
+
                     INSERT INTO partition_management_log (action, partition_name)
-                    VALUES ('Created partition', current_partition);
+                    VALUES ('Migrated to narrow layout', 'posts');
                 END IF;
-                
-                IF NOT EXISTS (
-                    SELECT FROM pg_class c 
-                    JOIN pg_namespace n ON n.oid = c.relnamespace
-                    WHERE c.relname = next_partition
+            END $$;
+        """)
+
+        logger.info("Adding Z-order spatial key to posts...")
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION posts_zorder_step(x bigint, shift integer, mask bigint)
+            RETURNS bigint AS $$
+                SELECT (x | (x << shift)) & mask;
+            $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+        """)
+        # Spreads the 31 low bits of x to the even bit positions (masks 0x0000FFFF0000FFFF ... 0x5555555555555555)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION posts_zorder_spread(x bigint)
+            RETURNS bigint AS $$
+                SELECT posts_zorder_step(posts_zorder_step(posts_zorder_step(posts_zorder_step(posts_zorder_step(
+                    x, 16, 281470681808895), 8, 71777214294589695), 4, 1085102592571150095),
+                    2, 3689348814741910323), 1, 6148914691236517205);
+            $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+        """)
+        # Must match app/zorder.py: 31 bits per axis, latitude on the even bits
+        cur.execute("DROP FUNCTION IF EXISTS posts_zorder(numeric, numeric);")
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION posts_zorder(latitude double precision, longitude double precision)
+            RETURNS bigint AS $$
+                SELECT posts_zorder_spread(least(greatest(floor((latitude + 90) / 180 * 2147483648)::bigint, 0), 2147483647))
+                     | (posts_zorder_spread(least(greatest(floor((longitude + 180) / 360 * 2147483648)::bigint, 0), 2147483647)) << 1);
+            $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+        """)
+        cur.execute("""
+            ALTER TABLE posts ADD COLUMN IF NOT EXISTS zorder BIGINT
+                GENERATED ALWAYS AS (posts_zorder(latitude, longitude)) STORED;
+        """)
+
+        # Wide view with the previous posts columns, for readers and read-only users
+        cur.execute("""
+            CREATE OR REPLACE VIEW posts_wide AS
+            SELECT p.asset_id, a.name, a.plate_number, a.vin, p.position_description,
+                   p.event_time, p.latitude, p.longitude, s.status_text, p.tenant,
+                   p.status_id, p.zorder
+            FROM posts p
+            LEFT JOIN assets a ON a.tenant = p.tenant AND a.asset_id = p.asset_id
+            LEFT JOIN status_codes s ON s.id = p.status_id;
+        """)
+
+        logger.info("Creating dead-letter table for rejected rows...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS posts_dead_letter (
+                id SERIAL PRIMARY KEY,
+                failed_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                asset_id INTEGER,
+                event_time TIMESTAMPTZ,
+                payload JSONB,
+                error TEXT
+            );
+        """)
+
+        logger.info("Creating latest-position table...")
+        # vehicle_latest only mirrors posts, so a table in the old wide layout is rebuilt from the backfill below
+        cur.execute("""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'vehicle_latest' AND column_name = 'status_text'
                 ) THEN
-                    EXECUTE format(
-                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF posts 
-                         FOR VALUES FROM (%L) TO (%L)',
-                        next_partition,
-                        partition_end,
-                        partition_end + interval '1 month'
-                    );
-                    
-                    EXECUTE format(
-                        'CREATE INDEX IF NOT EXISTS %I ON %I (event_time)',
-                        'idx_' || next_partition || '_event_time',
-                        next_partition
-                    );
-                    
-                    EXECUTE format(
-                        'CREATE INDEX IF NOT EXISTS %I ON %I (asset_id)',
-                        'idx_' || next_partition || '_asset_id',
-                        next_partition
-                    );
-                    
+                    DROP TABLE vehicle_latest;
                     INSERT INTO partition_management_log (action, partition_name)
-                    VALUES ('Created partition', next_partition);
+                    VALUES ('Dropped wide vehicle_latest for rebuild', 'vehicle_latest');
+                END IF;
+            END $$;
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS vehicle_latest (
+                tenant TEXT NOT NULL DEFAULT 'default',
+                asset_id INTEGER NOT NULL,
+                position_description TEXT,
+                event_time TIMESTAMPTZ NOT NULL,
+                latitude DOUBLE PRECISION,
+                longitude DOUBLE PRECISION,
+                status_id SMALLINT,
+                updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (tenant, asset_id)
+            );
+        """)
+        cur.execute("""
+            INSERT INTO vehicle_latest (
+                tenant, asset_id, position_description, event_time, latitude, longitude, status_id
+            )
+            SELECT DISTINCT ON (tenant, asset_id)
+                tenant, asset_id, position_description, event_time, latitude, longitude, status_id
+            FROM posts
+            WHERE NOT EXISTS (SELECT 1 FROM vehicle_latest)
+            ORDER BY tenant, asset_id, event_time DESC
+            ON CONFLICT (tenant, asset_id) DO NOTHING;
+        """)
+
+        logger.info("Creating columnar export state table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS partition_exports (
+                partition_name TEXT PRIMARY KEY,
+                change_marker TEXT NOT NULL,
+                row_count BIGINT,
+                path TEXT,
+                exported_at TIMESTAMPTZ
+            );
+        """)
+
+        logger.info("Creating maintenance log table...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS maintenance_log (
+                id SERIAL PRIMARY KEY,
+                timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                action TEXT,
+                object_name TEXT,
+                duration_ms INTEGER,
+                estimated_benefit_bytes BIGINT,
+                detail TEXT,
+                status TEXT
+            );
+        """)
+
+        logger.info("Creating downsampled summary table for retention...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS posts_summary (
+                tenant TEXT NOT NULL,
+                asset_id INTEGER NOT NULL,
+                bucket_start TIMESTAMPTZ NOT NULL,
+                first_time TIMESTAMPTZ,
+                last_time TIMESTAMPTZ,
+                first_latitude DOUBLE PRECISION,
+                first_longitude DOUBLE PRECISION,
+                last_latitude DOUBLE PRECISION,
+                last_longitude DOUBLE PRECISION,
+                distance_m DOUBLE PRECISION,
+                point_count INTEGER,
+                PRIMARY KEY (tenant, asset_id, bucket_start)
+            );
+        """)
+
+        logger.info(f"Configuring {partition_granularity} partition granularity...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS partition_config (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        cur.execute("""
+            INSERT INTO partition_config (key, value) VALUES ('granularity', %s)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+        """, (partition_granularity,))
+        cur.execute("""
+            INSERT INTO partition_config (key, value) VALUES ('index_profile', %s)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+        """, (index_profile,))
+
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION posts_partition_granularity()
+            RETURNS text AS $$
+                SELECT coalesce((SELECT value FROM partition_config WHERE key = 'granularity'), 'monthly');
+            $$ LANGUAGE sql STABLE;
+        """)
+        # Set by retention when it detaches partitions: nothing before it may get a partition again
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION posts_retired_before()
+            RETURNS timestamptz AS $$
+                SELECT (SELECT value FROM partition_config WHERE key = 'retired_before')::timestamptz;
+            $$ LANGUAGE sql STABLE;
+        """)
+
+        cur.execute(r"""
+            CREATE OR REPLACE VIEW posts_partition_ranges AS
+            SELECT c.relname::text AS partition_name,
+                   substring(pg_get_expr(c.relpartbound, c.oid) FROM 'FROM \(''([^'']+)''\)')::timestamptz AS range_start,
+                   substring(pg_get_expr(c.relpartbound, c.oid) FROM 'TO \(''([^'']+)''\)')::timestamptz AS range_end
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = 'posts';
+        """)
+
+        logger.info("Creating partition management functions...")
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION apply_posts_index_profile(partition_name text)
+            RETURNS void AS $$
+            DECLARE
+                profile text := coalesce((SELECT value FROM partition_config WHERE key = 'index_profile'), 'brin');
+            BEGIN
+                -- Bounding-box queries: tenant equality, Z-order ranges, then the time filter
+                EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (tenant, zorder, event_time)',
+                    'idx_' || partition_name || '_zorder', partition_name);
+
+                IF profile = 'btree' THEN
+                    EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (event_time)',
+                        'idx_' || partition_name || '_event_time', partition_name);
+                    EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (asset_id)',
+                        'idx_' || partition_name || '_asset_id', partition_name);
+                    EXECUTE format('DROP INDEX IF EXISTS %I', 'idx_' || partition_name || '_event_time_brin');
+                ELSE
+                    -- Rows arrive in event_time order, so a BRIN index prunes time ranges at a
+                    -- fraction of the size and write cost; (tenant, asset_id, event_time) lookups use the PK
+                    EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I USING brin (event_time) WITH (pages_per_range = 32)',
+                        'idx_' || partition_name || '_event_time_brin', partition_name);
+                    EXECUTE format('DROP INDEX IF EXISTS %I', 'idx_' || partition_name || '_event_time');
+                    EXECUTE format('DROP INDEX IF EXISTS %I', 'idx_' || partition_name || '_asset_id');
                 END IF;
             END;
             $$ LANGUAGE plpgsql;
         """)
 
+        # The result gained a created column, which CREATE OR REPLACE cannot add to an existing function
+        cur.execute("""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_proc
+                    WHERE proname = 'create_posts_partition'
+                      AND NOT 'created' = ANY(coalesce(proargnames, '{}'))
+                ) THEN
+                    DROP FUNCTION create_posts_partition(timestamptz);
+                END IF;
+            END $$;
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION create_posts_partition(ts timestamptz)
+            RETURNS TABLE (partition_name text, range_start timestamptz, range_end timestamptz, created boolean) AS $$
+            DECLARE
+                granularity text := posts_partition_granularity();
+                unit text;
+                name_format text;
+                existing record;
+            BEGIN
+                SELECT r.partition_name, r.range_start, r.range_end INTO existing
+                FROM posts_partition_ranges r
+                WHERE r.range_start <= ts AND ts < r.range_end;
+                IF FOUND THEN
+                    partition_name := existing.partition_name;
+                    range_start := existing.range_start;
+                    range_end := existing.range_end;
+                    created := false;
+                    RETURN NEXT;
+                    RETURN;
+                END IF;
+
+                unit := CASE granularity WHEN 'daily' THEN 'day' WHEN 'weekly' THEN 'week' ELSE 'month' END;
+                name_format := CASE granularity
+                    WHEN 'daily' THEN 'YYYY_MM_DD'
+                    WHEN 'weekly' THEN 'IYYY_"w"IW'
+                    ELSE 'YYYY_MM'
+                END;
+
+                range_start := date_trunc(unit, ts);
+                range_end := range_start + ('1 ' || unit)::interval;
+
+                -- Clamp to neighbouring partitions so a granularity change never overlaps older ranges
+                range_start := greatest(range_start,
+                    (SELECT max(r.range_end) FROM posts_partition_ranges r WHERE r.range_end <= ts));
+                range_end := least(range_end,
+                    (SELECT min(r.range_start) FROM posts_partition_ranges r WHERE r.range_start > ts));
+                partition_name := 'posts_' || to_char(range_start, name_format);
+
+                -- Late or replayed rows must not recreate a range retention already summarized and archived
+                IF ts < posts_retired_before() THEN
+                    RAISE EXCEPTION 'Cannot create partition for %: ranges before % were retired by retention',
+                        ts, posts_retired_before();
+                END IF;
+
+                -- A table of that name that is not attached (e.g. detached by retention) would
+                -- make CREATE TABLE IF NOT EXISTS a silent no-op and the range look covered
+                IF to_regclass(quote_ident(partition_name)) IS NOT NULL THEN
+                    RAISE EXCEPTION 'Table % exists but is not a partition of posts, cannot create partition for %',
+                        partition_name, ts;
+                END IF;
+
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF posts
+                     FOR VALUES FROM (%L) TO (%L)',
+                    partition_name,
+                    range_start,
+                    range_end
+                );
+
+                PERFORM apply_posts_index_profile(partition_name);
+
+                INSERT INTO partition_management_log (action, partition_name)
+                VALUES ('Created partition', partition_name);
+                created := true;
+                RETURN NEXT;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION manage_partitions() 
+            RETURNS void AS $$
+            DECLARE
+                granularity text := posts_partition_granularity();
+                step interval;
+                periods_ahead integer;
+            BEGIN
+                step := CASE granularity
+                    WHEN 'daily' THEN interval '1 day'
+                    WHEN 'weekly' THEN interval '1 week'
+                    ELSE interval '1 month'
+                END;
+                periods_ahead := CASE granularity WHEN 'daily' THEN 7 WHEN 'weekly' THEN 4 ELSE 1 END;
+
+                FOR i IN 0..periods_ahead LOOP
+                    PERFORM create_posts_partition(CURRENT_TIMESTAMP + step * i);
+                END LOOP;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
         logger.info("Creating backup management function...")
         cur.execute("""
             CREATE OR REPLACE FUNCTION manage_backups() 
@@ -354,6 +681,11 @@ def init_database():
             GRANT CONNECT ON DATABASE {db_config['database']} TO {readonly_user};
             GRANT USAGE ON SCHEMA public TO {readonly_user};
             GRANT SELECT ON posts TO {readonly_user};
+            GRANT SELECT ON posts_summary TO {readonly_user};
+            GRANT SELECT ON vehicle_latest TO {readonly_user};
+            GRANT SELECT ON posts_wide TO {readonly_user};
+            GRANT SELECT ON assets TO {readonly_user};
+            GRANT SELECT ON status_codes TO {readonly_user};
             ALTER DEFAULT PRIVILEGES IN SCHEMA public 
                 GRANT SELECT ON TABLES TO {readonly_user};
         """)
@@ -381,7 +713,15 @@ def init_database():
         logger.info("Creating initial partitions...")
         cur.execute("SELECT manage_partitions();")
 
-        logger.info("Schema and partitioning setup completed successfully")
+        logger.info(f"Applying {index_profile} index profile to existing partitions...")
+        cur.execute("SELECT apply_posts_index_profile(partition_name) FROM posts_partition_ranges;")
+
+        cur.execute("""
+            INSERT INTO partition_config (key, value) VALUES ('schema_version', %s)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+        """, (str(SCHEMA_VERSION),))
+
+        logger.info(f"Schema and partitioning setup completed successfully (schema version {SCHEMA_VERSION})")
         return True
 
     except Exception as e:
@@ -0,0 +1,209 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from accounts import Account
+from async_pipeline import AsyncFetcher, poll_once
+from last_seen_cache import LastSeenCache
+from rate_limiter import TokenBucket
+from token_cache import TokenCache
+
+ASSETS = [
+    {"id": 1, "name": "Truck 1", "position": "Luxembourg"},
+    {"id": 2, "name": "Truck 2", "position": "Esch-sur-Alzette"},
+]
+
+class StubApi(BaseHTTPRequestHandler):
+    """Minimal /login and /v1/assets/ stand-in; state lives on the server object."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        api = self.server
+        if self.path != '/login':
+            return self._reply(404)
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        api.logins += 1
+        if body != {"username": "user", "password": "secret"}:
+            return self._reply(401, {"error": "bad credentials"})
+        token = f"token-{next(api.token_ids)}"
+        api.valid_tokens.add(token)
+        return self._reply(200, {"token": token, "expires_in": 3600})
+
+    def do_GET(self):
+        api = self.server
+        if self.path != '/v1/assets/':
+            return self._reply(404)
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        api.asset_requests.append((time.monotonic(), token))
+        if api.revoke_next:
+            api.valid_tokens.discard(token)
+            api.revoke_next = False
+        if token not in api.valid_tokens:
+            return self._reply(401, {"error": "token expired"})
+        return self._reply(200, ASSETS)
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubApi)
+    server.logins = 0
+    server.token_ids = itertools.count(1)
+    server.valid_tokens = set()
+    server.asset_requests = []
+    server.revoke_next = False
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+class FakeWriter:
+    def __init__(self, succeed=True):
+        self.succeed = succeed
+        self.batches = []
+
+    async def store(self, rows):
+        self.batches.append(rows)
+        return self.succeed
+
+def prepare(assets_data):
+    """Rows in posts column order, enough for LastSeenCache."""
+    return [
+        (asset["id"], asset["name"], '', '', asset["position"], '2024-01-01T00:00:00Z', 49.6, 6.1, 'Parked', 'default')
+        for asset in assets_data
+    ]
+
+def make_account(api, rate_limiter=None):
+    return Account(
+        tenant='default',
+        base_url=api.base_url,
+        username='user',
+        password='secret',
+        session=None,
+        token_cache=TokenCache(3600, 60),
+        rate_limiter=rate_limiter or TokenBucket(10, 10)
+    )
+
+async def poll(fetcher, writer, cycles=1, cache=None, on_failed=None):
+    cache = cache or LastSeenCache(0)
+    try:
+        return [await poll_once(fetcher, writer, prepare, cache, on_failed) for _ in range(cycles)]
+    finally:
+        await fetcher.close()
+
+def test_poll_once_stores_prepared_rows(api):
+    writer = FakeWriter()
+    results = asyncio.run(poll(AsyncFetcher(make_account(api)), writer))
+
+    assert results == [(True, 0)]
+    assert [row[0] for row in writer.batches[0]] == [1, 2]
+
+def test_token_is_reused_across_cycles(api):
+    writer = FakeWriter()
+    results = asyncio.run(poll(AsyncFetcher(make_account(api)), writer, cycles=3))
+
+    assert results == [(True, 0)] * 3
+    assert api.logins == 1
+    assert {token for _, token in api.asset_requests} == {'token-1'}
+
+def test_401_logs_in_again_and_retries(api):
+    writer = FakeWriter()
+    fetcher = AsyncFetcher(make_account(api))
+
+    async def scenario():
+        try:
+            first = await poll_once(fetcher, writer, prepare, LastSeenCache(0))
+            api.revoke_next = True
+            second = await poll_once(fetcher, writer, prepare, LastSeenCache(0))
+            return first, second
+        finally:
+            await fetcher.close()
+
+    assert asyncio.run(scenario()) == ((True, 0), (True, 0))
+    assert api.logins == 2
+    assert [token for _, token in api.asset_requests] == ['token-1', 'token-1', 'token-2']
+    assert len(writer.batches) == 2
+
+def test_rejected_credentials_fail_without_fetching(api):
+    account = make_account(api)
+    account.password = 'wrong'
+    writer = FakeWriter()
+
+    assert asyncio.run(poll(AsyncFetcher(account), writer)) == [(False, 0)]
+    assert api.asset_requests == []
+    assert writer.batches == []
+
+def test_rate_limiter_delays_requests_without_failing(api):
+    # One request up front, then one every 0.2s
+    writer = FakeWriter()
+    fetcher = AsyncFetcher(make_account(api, TokenBucket(1, 5)))
+
+    results = asyncio.run(poll(fetcher, writer, cycles=3))
+
+    assert results == [(True, 0)] * 3
+    times = [when for when, _ in api.asset_requests]
+    assert times[1] - times[0] >= 0.15
+    assert times[2] - times[1] >= 0.15
+
+def test_rate_limiter_wait_does_not_block_other_accounts(api):
+    slow = AsyncFetcher(make_account(api, TokenBucket(1, 2)))
+    fast = AsyncFetcher(make_account(api))
+    writer = FakeWriter()
+
+    async def scenario():
+        try:
+            await poll_once(slow, writer, prepare, LastSeenCache(0))
+            started = time.monotonic()
+            slow_cycle = asyncio.create_task(poll_once(slow, writer, prepare, LastSeenCache(0)))
+            await poll_once(fast, writer, prepare, LastSeenCache(0))
+            fast_done = time.monotonic() - started
+            await slow_cycle
+            return fast_done, time.monotonic() - started
+        finally:
+            await slow.close()
+            await fast.close()
+
+    fast_done, slow_done = asyncio.run(scenario())
+    assert fast_done < 0.3
+    assert slow_done >= 0.4
+
+def test_failed_store_hands_rows_to_on_failed(api):
+    failed = []
+    results = asyncio.run(poll(AsyncFetcher(make_account(api)), FakeWriter(succeed=False), on_failed=failed.append))
+
+    assert results == [(False, 0)]
+    assert [row[0] for row in failed[0]] == [1, 2]
+
+def test_prepare_and_on_failed_run_off_the_event_loop(api):
+    threads = []
+
+    def threaded_prepare(assets_data):
+        threads.append(threading.current_thread())
+        return prepare(assets_data)
+
+    async def scenario():
+        fetcher = AsyncFetcher(make_account(api))
+        try:
+            return await poll_once(fetcher, FakeWriter(succeed=False), threaded_prepare, LastSeenCache(0),
+                                   lambda rows: threads.append(threading.current_thread()))
+        finally:
+            await fetcher.close()
+
+    assert asyncio.run(scenario()) == (False, 0)
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
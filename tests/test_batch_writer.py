@@ -0,0 +1,50 @@
+from batch_writer import BatchWriter
+
+def make_writer(store, failed=None):
+    return BatchWriter(
+        store=store,
+        on_stored=lambda rows: None,
+        on_failed=failed.extend if failed is not None else None,
+        key=lambda row: row[0],
+        flush_interval=60,
+        max_attempts=1
+    )
+
+def test_failed_flush_is_reported_even_though_submit_succeeded():
+    failed = []
+    writer = make_writer(lambda rows: False, failed)
+    writer.start()
+
+    assert writer.submit([(1, 'a'), (2, 'b')])
+    writer.stop()
+
+    assert not writer.healthy()
+    stats = writer.stats()
+    assert stats["status"] == "unhealthy"
+    assert stats["failed_flushes"] == 1
+    assert stats["last_flush_error"] == "store failed after 1 attempts"
+    assert failed == [(1, 'a'), (2, 'b')]
+
+def test_exception_message_is_kept_as_last_flush_error():
+    def store(rows):
+        raise ConnectionError("server closed the connection")
+
+    writer = make_writer(store)
+    writer.start()
+    writer.submit([(1, 'a')])
+    writer.stop()
+
+    assert writer.stats()["last_flush_error"] == "server closed the connection after 1 attempts"
+
+def test_successful_flush_is_healthy():
+    stored = []
+    writer = make_writer(lambda rows: stored.extend(rows) or True)
+
+    assert writer.healthy()
+    writer.start()
+    writer.submit([(1, 'a'), (1, 'b')])
+    writer.stop()
+
+    assert writer.healthy()
+    assert writer.stats()["last_flush_error"] is None
+    assert stored == [(1, 'b')]
@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+
+from dateutil.relativedelta import relativedelta
+
+import partition_handler
+from partition_handler import PartitionManager
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+class MonthlyPartitions:
+    """Stands in for create_posts_partition(): monthly ranges, recording every call."""
+
+    def __init__(self):
+        self.created = []
+
+    def __call__(self, conn, ts):
+        start = utc(ts.year, ts.month, 1)
+        self.created.append(start)
+        return start, start + relativedelta(months=1)
+
+def loaded_manager(*ranges):
+    manager = PartitionManager()
+    for start, end in ranges:
+        manager._add_range(start, end)
+    manager._loaded = True
+    return manager
+
+def test_ensure_timestamps_creates_only_partitions_with_rows(monkeypatch):
+    create = MonthlyPartitions()
+    monkeypatch.setattr(partition_handler, 'create_partition_for_date', create)
+    manager = loaded_manager((utc(2024, 6, 1), utc(2024, 7, 1)))
+
+    assert manager.ensure_timestamps(None, [utc(1970, 1, 1), utc(2024, 6, 15), utc(2024, 9, 3), utc(2024, 9, 4)])
+
+    assert create.created == [utc(1970, 1, 1), utc(2024, 9, 1)]
+    assert manager.covers([utc(1970, 1, 1), utc(2024, 6, 15), utc(2024, 9, 30)])
+    assert not manager.covers([utc(2024, 8, 1)])
+
+def test_ensure_timestamps_without_gap_creates_nothing(monkeypatch):
+    create = MonthlyPartitions()
+    monkeypatch.setattr(partition_handler, 'create_partition_for_date', create)
+    manager = loaded_manager((utc(2024, 6, 1), utc(2024, 7, 1)), (utc(2024, 7, 1), utc(2024, 8, 1)))
+
+    assert manager.ensure_timestamps(None, [utc(2024, 6, 2), utc(2024, 7, 31, 23)])
+    assert create.created == []
+
+def test_ensure_timestamps_stops_when_creation_fails(monkeypatch):
+    monkeypatch.setattr(partition_handler, 'create_partition_for_date', lambda conn, ts: None)
+    manager = loaded_manager()
+
+    assert not manager.ensure_timestamps(None, [utc(2024, 6, 2)])
+    assert not manager.covers([utc(2024, 6, 2)])
+
+def test_covers_is_false_until_loaded():
+    assert not PartitionManager().covers([utc(2024, 6, 2)])
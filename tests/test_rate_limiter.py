@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from rate_limiter import TokenBucket
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def test_burst_up_to_capacity(clock):
+    bucket = TokenBucket(4, 4 / 60, clock=clock)
+    assert [bucket.try_acquire() for _ in range(5)] == [True, True, True, True, False]
+
+def test_refill_over_time(clock):
+    bucket = TokenBucket(4, 4 / 60, clock=clock)
+    for _ in range(4):
+        bucket.try_acquire()
+
+    clock.advance(14.9)
+    assert not bucket.try_acquire()
+    clock.advance(0.1)
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+def test_refill_never_exceeds_capacity(clock):
+    bucket = TokenBucket(4, 4 / 60, clock=clock)
+    bucket.try_acquire()
+    clock.advance(3600)
+    assert bucket.available() == 4
+    assert [bucket.try_acquire() for _ in range(5)] == [True, True, True, True, False]
+
+def test_time_until_available(clock):
+    bucket = TokenBucket(4, 4 / 60, clock=clock)
+    assert bucket.time_until_available() == 0.0
+    for _ in range(4):
+        bucket.try_acquire()
+
+    assert bucket.time_until_available() == pytest.approx(15.0)
+    clock.advance(10)
+    assert bucket.time_until_available() == pytest.approx(5.0)
+    assert bucket.time_until_available(tokens=2) == pytest.approx(20.0)
+    clock.advance(5)
+    assert bucket.time_until_available() == pytest.approx(0.0)
+
+def test_time_until_available_does_not_consume(clock):
+    bucket = TokenBucket(1, 1.0, clock=clock)
+    bucket.time_until_available()
+    assert bucket.try_acquire()
+
+def test_concurrent_try_acquire_grants_exactly_capacity(clock):
+    bucket = TokenBucket(50, 1.0, clock=clock)
+    results = []
+    results_lock = threading.Lock()
+    start = threading.Barrier(20)
+
+    def worker():
+        start.wait()
+        granted = sum(bucket.try_acquire() for _ in range(10))
+        with results_lock:
+            results.append(granted)
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The clock is frozen, so no refill happens while the threads race
+    assert sum(results) == 50
+    assert not bucket.try_acquire()